@@ -1,25 +1,469 @@
 #!/usr/bin/env python
 
 #######################################
-# Terraform:            Creates 3x VM's in KVM based on baseline *.qcow2 disk
-#                       Baseline image requires deletion of network profile and re-create at boot via cronjob
-# Ansible_Prep:         Collects DHCP IP and creates inventory and ansible.cfg 
+# Terraform:            Creates 1x master and --workers VM's in KVM based on baseline *.qcow2 disk
+#                       Hostname, static IP, gateway and DNS are set at first boot by a cloud-init NoCloud seed
+#                       vCPU's, memory, pinning, NUMA and hugepages come from the role of each node (--cpu-profile)
+# Ansible_Prep:         Creates inventory and ansible.cfg from the static IP's and waits for SSH
 # Ansible_Baseline:     Installs and performs configurations required prior to K8 initialization
+#                       (only per node settings when building from a golden image)
 # Ansible_K8_Config:    Performs "init", token generation and worker node join
 # Cleanup:              Removes only the files and directories created by this script
+# Bake:                 "./k8-create.py bake" - bakes the node-agnostic baseline into a versioned golden image
+# Benchmark:            "./k8-create.py benchmark" - runs and destroys --runs builds and flags regressions against the history
+#                       Every run writes a timing report (phases, commands, playbooks) to ~/k8-kvm-logs
+# Disk_Benchmark:       "./k8-create.py disk-benchmark" - runs fio inside every node of the running cluster (--disk-profile)
+# Net_Benchmark:        "./k8-create.py net-benchmark" - measures pod-to-pod throughput between the nodes with iperf3 (--net-profile)
+# Storage_Benchmark:    "./k8-create.py storage-benchmark" - runs fio from a pod on every node on a claim of every StorageClass (--nfs-class)
+# Memory_Report:        "./k8-create.py memory-report" - resident memory of every VM and the KSM savings (--density)
 #
 #######################################
 print("\nVersion: 1.0.1\n")
 
 import os
 import subprocess
-import re           # used for searching IP
+import argparse     # used for command line options
 import time         # used to wait for obtaining IP
 import pathlib      # used for deleting files
 import shutil       # used for deleting dir's
+import socket       # used for checking open ports on the VM's
+import ipaddress    # used for assigning static IP's from the IP range
+import hashlib      # used for versioning the golden image
+import json         # used for reading ansible events and writing reports
+import ssl          # used for the API server readiness check (self-signed certificate)
+import urllib.request  # used for the API server readiness check
+import sys          # used for re-running this script from the benchmark command
+import statistics   # used for the benchmark baseline
+from concurrent.futures import ThreadPoolExecutor  # used for querying VM's in parallel
+
+try:
+    import libvirt  # python3-libvirt - used for IP discovery, falls back to virsh when not installed
+except ImportError:
+    libvirt = None
 
 HOME_DIR = os.path.expanduser("~/")
 
+# Baseline image all VM's are cloned from
+BASELINE_IMAGE = "/mnt/usb_drive/kvm/disk/ol9-kvm-baseline.qcow2"
+
+# SSH keypair injected into the VM's at clone time and used by ansible instead of the root password
+SSH_KEY = HOME_DIR + ".ssh/k8-kvm_ed25519"
+
+# Ansible event logs and task timing tables - kept after cleanup
+LOG_DIR = HOME_DIR + "k8-kvm-logs/"
+
+# Phases finished by the last build, read by --resume - removed by Cleanup when a build completes
+RUN_STATE_FILE = HOME_DIR + ".k8-create-state.json"
+
+# sha256 of every generated artifact at its last successful apply - kept between builds
+ARTIFACT_HASH_FILE = HOME_DIR + ".k8-create-hashes.json"
+
+# Generated artifacts in the order they are applied - applying one invalidates the hashes of the ones after it
+ARTIFACT_ORDER = ["main.tf", "baseline_playbook.yaml", "k8_playbook.yaml", "join_playbook.yaml"]
+
+# Working directory of the temporary VM used by "bake"
+BAKE_DIR = HOME_DIR + "k8-bake/"
+
+# Upstream package repo's, packages and files installed on the nodes
+RPM_REPOS = {
+    "kubernetes": "https://pkgs.k8s.io/core:/stable:/v1.28/rpm/",
+    "cri-o": "https://pkgs.k8s.io/addons:/cri-o:/prerelease:/main/rpm/",
+}
+BASE_PACKAGES = ["conntrack", "container-selinux", "ebtables", "ethtool", "iptables", "socat", "nfs-utils", "pip", "fio"]
+PIP_PACKAGES = ["openshift", "pyyaml"]
+HELM_VERSION = "v3.17.3"
+CSI_NFS_VERSION = "v4.11.0"
+MIRROR_FILES = {
+    "kube-flannel.yml": "https://github.com/flannel-io/flannel/releases/latest/download/kube-flannel.yml",
+    "helm-linux-amd64.tar.gz": "https://get.helm.sh/helm-" + HELM_VERSION + "-linux-amd64.tar.gz",
+}
+for manifest in ["rbac-csi-nfs.yaml", "csi-nfs-driverinfo.yaml", "csi-nfs-controller.yaml", "csi-nfs-node.yaml"]:
+    MIRROR_FILES["csi-driver-nfs/" + manifest] = "https://raw.githubusercontent.com/kubernetes-csi/csi-driver-nfs/master/deploy/" + CSI_NFS_VERSION + "/" + manifest
+
+# Local mirror served from the KVM host by "./k8-create.py mirror" - an nginx container for the
+# dnf repo's, pip packages and files, and a pull-through registry container per upstream registry
+MIRROR_DIR = "/var/lib/k8-mirror/"
+
+# Terraform provider - installed from the provider mirror when "./k8-create.py mirror" created one on this host,
+# downloaded once into the plugin cache otherwise
+LIBVIRT_PROVIDER = "dmacvicar/libvirt"
+LIBVIRT_PROVIDER_VERSION = "0.8.3"
+TERRAFORM_PROVIDER_MIRROR = MIRROR_DIR + "terraform/"
+TERRAFORM_PLUGIN_CACHE = HOME_DIR + ".terraform.d/plugin-cache/"
+TERRAFORM_CLI_CONFIG = HOME_DIR + ".k8-create.tfrc"
+TERRAFORM_PLAN = HOME_DIR + "k8.tfplan"
+
+# Seconds terraform took to create / change / destroy every resource, keyed by resource address
+TERRAFORM_RESOURCE_TIMES = {}
+MIRROR_HTTP_PORT = 8080
+MIRROR_REGISTRIES = {
+    "registry.k8s.io": ("https://registry.k8s.io", 5001),
+    "docker.io": ("https://registry-1.docker.io", 5002),
+    "quay.io": ("https://quay.io", 5003),
+    "ghcr.io": ("https://ghcr.io", 5004),
+    "cr.fluentbit.io": ("https://cr.fluentbit.io", 5005),
+    "docker.elastic.co": ("https://docker.elastic.co", 5006),
+}
+
+# Static IP's are assigned to the VM's from --ip-range, in order: master then workers
+NODE_PREFIX = 24
+NODE_GATEWAY = "192.168.1.1"
+NODE_DNS = "192.168.1.1"
+
+# Readiness polling - seconds per host before giving up and backoff between checks
+READY_TIMEOUT = 600
+READY_BACKOFF_START = 1
+READY_BACKOFF_MAX = 15
+
+# Seconds each host took to become ready, keyed by wait label then host
+READINESS_TIMES = {}
+
+# Pod network of the flannel manifest and the CRI-O socket used by kubeadm
+POD_NETWORK_CIDR = "10.244.0.0/16"
+CRI_SOCKET = "unix:///var/run/crio/crio.sock"
+
+# Lifetime of the bootstrap token minted for the worker join
+JOIN_TOKEN_TTL = "30m"
+
+# Seconds of the join command and of the kubelet start after the join playbook, keyed by worker
+JOIN_TIMES = {}
+
+# NFS share mounted on every node and provisioned by the nfs-csi driver
+NFS_SERVER = "192.168.1.99"
+NFS_SHARE = "/mnt/usb_drive"
+
+# NFS client mount option profiles - used for the node mount (--nfs-mount-profile) and the StorageClasses (--nfs-class)
+# default: no options, the client negotiates the version, throughput: several TCP connections and 1M reads / writes, metadata: long attribute cache for many small files
+NFS_MOUNT_PROFILES = {
+    "default": [],
+    "throughput": ["nfsvers=4.2", "nconnect=8", "rsize=1048576", "wsize=1048576", "hard", "timeo=600", "noatime"],
+    "metadata": ["nfsvers=4.2", "nconnect=4", "actimeo=60", "lookupcache=all", "hard", "noatime", "nodiratime"],
+}
+
+# NFS StorageClasses and their mount profile - nfs-csi is the default class, --nfs-class adds or changes classes
+NFS_STORAGE_CLASSES = {"nfs-csi": "default"}
+
+# Label with the role of every node (control-plane, worker or logging) - k8-kvm-efk.py places Elasticsearch with it
+NODE_ROLE_LABEL = "k8-on-kvm/role"
+
+# Node-local StorageClass on the data disk of the logging workers (--local-storage) - one static PV per logging worker
+LOCAL_STORAGE_CLASS = "local-storage"
+LOCAL_STORAGE_DIR = "/mnt/local-storage"
+# The Elasticsearch claim of k8-kvm-efk.py - a smaller PV can never bind it
+LOCAL_STORAGE_MIN_GIB = 20
+
+# Dedicated etcd disk of the control plane (--etcd-disk) - mounted over the etcd data directory, GiB of a pool volume
+ETCD_DATA_DIR = "/var/lib/etcd"
+ETCD_DISK_SIZE = 20
+
+# etcd flags of a control plane with --etcd-disk - the longer heartbeat and election timeout keep a slow fsync from
+# being taken for a lost leader, the quota raises the 2 GiB default
+ETCD_DISK_ARGS = {"heartbeat-interval": "250", "election-timeout": "2500", "snapshot-count": "10000",
+                  "quota-backend-bytes": str(8 * 1024 ** 3)}
+
+# etcd flags passed through the kubeadm ClusterConfiguration - ETCD_DISK_ARGS with --etcd-disk, --etcd-arg adds or overrides
+ETCD_EXTRA_ARGS = {}
+
+# --etcd-check - 99th percentile fdatasync latency the etcd disk should stay under (etcd guidance) and the results
+ETCD_FSYNC_P99_LIMIT_MS = 10
+ETCD_CHECK = {}
+
+# VM size of each node role as (vCPU's, memory MiB) - --node-size overrides
+ROLE_SIZES = {"control-plane": (4, 8096), "worker": (4, 8096), "logging": (8, 16384)}
+
+# CPU profiles - "shared": vCPU's float over the host CPU's not pinned to another VM, "pinned": every vCPU pinned
+# to its own host CPU on one NUMA node with strict NUMA memory, "pinned-hugepages": pinned and backed by 2M hugepages
+CPU_PROFILES = ["shared", "pinned", "pinned-hugepages"]
+ROLE_CPU_PROFILES = {"control-plane": "shared", "worker": "shared", "logging": "shared"}
+
+# Host CPU's kept per NUMA node for the host and the emulator threads of the pinned VM's on that node
+HOST_RESERVED_CPUS = 1
+HOST_NUMA_DIR = "/sys/devices/system/node/"
+HOST_HUGEPAGES_DIR = "/sys/kernel/mm/hugepages/hugepages-2048kB/"
+
+# Disk I/O profiles of the VM disks - bus, cache and io mode, discard and an iothread per disk ("default" keeps the
+# provider defaults: virtio-blk, hypervisor default cache, no discard, disk I/O on the main QEMU thread)
+DISK_PROFILES = {
+    "default": None,
+    "virtio-blk": {"bus": "virtio", "cache": "none", "io": "native", "discard": "unmap"},
+    "virtio-scsi": {"bus": "scsi", "cache": "none", "io": "native", "discard": "unmap"},
+    "writeback": {"bus": "virtio", "cache": "writeback", "io": "threads", "discard": "unmap"},
+}
+ROLE_DISK_PROFILES = {"control-plane": "default", "worker": "default", "logging": "default"}
+
+# Optional second disk per node role as (GiB, mount point in the guest) - --data-disk
+ROLE_DATA_DISKS = {}
+DATA_DISK_MOUNT = "/var/lib/k8-data"
+
+# fio jobs of the disk benchmark, run in the guests one after the other on the root disk and the data disk
+# fdatasync is the write pattern of the etcd WAL (small sequential writes, each one synced)
+FIO_JOBS = {
+    "seq-write-1m": ["--rw=write", "--bs=1M", "--size=1G", "--ioengine=libaio", "--iodepth=16", "--direct=1"],
+    "rand-read-4k": ["--rw=randread", "--bs=4k", "--size=1G", "--ioengine=libaio", "--iodepth=32", "--direct=1"],
+    "rand-write-4k": ["--rw=randwrite", "--bs=4k", "--size=1G", "--ioengine=libaio", "--iodepth=32", "--direct=1"],
+    "fdatasync": ["--rw=write", "--bs=2300", "--size=22m", "--ioengine=sync", "--fdatasync=1"],
+}
+FIO_RUNTIME = 30
+
+# Network profiles of the br0 interface - "default" keeps the provider defaults (one queue pair), "multiqueue" uses
+# virtio-net on the vhost-net backend with a queue pair per vCPU, spread over the vCPU's in the guest with RPS/RFS and XPS
+NET_PROFILES = ["default", "multiqueue"]
+ROLE_NET_PROFILES = {"control-plane": "default", "worker": "default", "logging": "default"}
+NET_RX_QUEUE_SIZE = 1024
+
+# kubectl on the master for the commands run over SSH
+KUBECTL = "kubectl --kubeconfig /etc/kubernetes/admin.conf"
+
+# iperf3 pod-to-pod benchmark - one server pod per node, every node sends to the next one
+NET_BENCHMARK_NAMESPACE = "k8-net-benchmark"
+IPERF3_IMAGE = "docker.io/networkstatic/iperf3:latest"
+IPERF3_SECONDS = 15
+IPERF3_STREAMS = 4
+
+# fio storage benchmark - a claim of every StorageClass is written by a pod on every node, one pod at a time, with the
+# FIO_JOBS of the disk benchmark
+STORAGE_BENCHMARK_NAMESPACE = "k8-storage-benchmark"
+FIO_IMAGE = "docker.io/xridge/fio:latest"
+STORAGE_BENCHMARK_CLAIM = "2Gi"
+
+# Density mode - KSM settings written to the host and the balloon statistics period of the guests (seconds)
+HOST_KSM_DIR = "/sys/kernel/mm/ksm/"
+KSM_SETTINGS = {"pages_to_scan": "1000", "sleep_millisecs": "20", "run": "1"}
+BALLOON_STATS_PERIOD = 10
+
+# Ansible execution profiles and the profile each playbook runs with unless --ansible-profile overrides it
+ANSIBLE_CFG_FILES = {"standard": "ansible.cfg", "performance": "ansible-performance.cfg"}
+ANSIBLE_PLAYBOOK_PROFILES = {"bake": "performance", "baseline": "performance", "k8": "performance", "join": "performance"}
+
+# Profile and seconds of every playbook run, keyed by playbook
+PLAYBOOK_TIMES = {}
+
+# Seconds of every task, keyed by playbook then host: [(task, seconds)]
+PLAYBOOK_TASK_TIMES = {}
+
+# Seconds of every phase run by main_function, in order
+PHASE_TIMES = {}
+
+# Phases skipped by --resume
+SKIPPED_PHASES = []
+
+# Subprocesses spawned by each phase, keyed by phase then command: {"count": N, "seconds": S, "failed": N}
+COMMAND_TIMES = {}
+CURRENT_PHASE = None
+
+# Benchmark history and regression limits - a phase is flagged when it is slower than the baseline by
+# more than the threshold percentage and more than the minimum seconds (ignores noise on short phases)
+BENCHMARK_HISTORY = LOG_DIR + "benchmark-history.jsonl"
+BENCHMARK_BASELINE_RUNS = 5
+REGRESSION_MIN_SECONDS = 5
+
+parser = argparse.ArgumentParser(description="Creates a K8 cluster on KVM from the baseline qcow2 image")
+parser.add_argument("command", nargs="?", choices=["build", "bake", "mirror", "benchmark", "disk-benchmark", "net-benchmark", "storage-benchmark", "memory-report"], default="build",
+                    help="build: create the cluster (default), bake: create the golden image from the baseline image, "
+                         "mirror: create or refresh the local package and image mirror on this host, "
+                         "benchmark: run --runs builds, destroying each cluster, and compare them against the history, "
+                         "disk-benchmark: run fio inside every node of the running cluster, "
+                         "net-benchmark: measure pod-to-pod throughput between the nodes of the running cluster with iperf3, "
+                         "storage-benchmark: run fio from a pod on every node of the running cluster on a claim of every StorageClass, "
+                         "memory-report: print the resident memory of every VM and the KSM savings on this host")
+parser.add_argument("--mirror", metavar="HOST_IP",
+                    help="install packages and pull images from the local mirror at this KVM host IP")
+parser.add_argument("--no-golden", action="store_true",
+                    help="build from the baseline image even if a golden image exists")
+parser.add_argument("--clone-mode", choices=["linked", "full"], default="linked",
+                    help="linked: thin qcow2 overlay per VM backed by one imported base volume (default), full: full copy of the baseline per VM")
+parser.add_argument("--workers", type=int, default=2,
+                    help="number of worker nodes (default: 2)")
+parser.add_argument("--ip-range", default="192.168.1.200-192.168.1.254",
+                    help="static IP range for the nodes as FIRST-LAST (default: 192.168.1.200-192.168.1.254)")
+parser.add_argument("--logging-workers", type=int, default=0, metavar="N",
+                    help="the last N of the --workers are logging workers (Elasticsearch) with their own size and CPU profile (default: 0)")
+parser.add_argument("--node-size", action="append", default=[], metavar="ROLE=VCPUS:MEMORY_MB",
+                    help="vCPU's and memory of one node role (control-plane, worker or logging) - can be repeated "
+                         "(default: control-plane=4:8096, worker=4:8096, logging=8:16384)")
+parser.add_argument("--cpu-profile", action="append", default=[], metavar="[ROLE=]PROFILE",
+                    help="CPU profile (shared, pinned or pinned-hugepages) for all node roles, or for one role "
+                         "(control-plane, worker or logging) as ROLE=PROFILE - can be repeated (default: shared)")
+parser.add_argument("--disk-profile", action="append", default=[], metavar="[ROLE=]PROFILE",
+                    help="disk I/O profile (default, virtio-blk, virtio-scsi or writeback) for all node roles, or for one role "
+                         "as ROLE=PROFILE - can be repeated (default: default)")
+parser.add_argument("--data-disk", action="append", default=[], metavar="ROLE=GIB[:MOUNT]",
+                    help="attach a second disk of GIB to every node of a role, formatted xfs and mounted at MOUNT "
+                         "(default: " + DATA_DISK_MOUNT + ") - can be repeated")
+parser.add_argument("--local-storage", type=int, default=0, metavar="GIB",
+                    help="give every logging worker a data disk of GIB for the node-local StorageClass " + LOCAL_STORAGE_CLASS +
+                         " (Elasticsearch data - at least " + str(LOCAL_STORAGE_MIN_GIB) + ") - requires --logging-workers")
+parser.add_argument("--nfs-mount-profile", choices=list(NFS_MOUNT_PROFILES), default="default",
+                    help="NFS mount option profile of the " + NFS_SHARE + " mount on the nodes (default: default)")
+parser.add_argument("--nfs-class", action="append", default=[], metavar="NAME=PROFILE",
+                    help="NFS StorageClass with the mount options of a profile (default, throughput or metadata) - can be repeated, "
+                         "nfs-csi (the default class) uses the default profile unless it is given here")
+parser.add_argument("--storage-class", action="append", default=[], metavar="NAME",
+                    help="storage-benchmark: only benchmark this StorageClass - can be repeated (default: every class with a provisioner)")
+parser.add_argument("--net-profile", action="append", default=[], metavar="[ROLE=]PROFILE",
+                    help="network profile (default or multiqueue) for all node roles, or for one role as ROLE=PROFILE "
+                         "- can be repeated (default: default)")
+parser.add_argument("--etcd-disk", metavar="POOL[:GIB]|/dev/BLOCK",
+                    help="give etcd its own disk on the control-plane node, mounted at " + ETCD_DATA_DIR + ": a volume in this "
+                         "libvirt storage pool (e.g. a host-local SSD pool, default " + str(ETCD_DISK_SIZE) + " GiB) or this host block device (e.g. a raw LV)")
+parser.add_argument("--etcd-arg", action="append", default=[], metavar="FLAG=VALUE",
+                    help="etcd flag for the kubeadm configuration, without the leading -- (can be repeated)")
+parser.add_argument("--etcd-check", action="store_true",
+                    help="measure the etcd disk with fio (fdatasync) before kubeadm init and run \"etcdctl check perf\" after it")
+parser.add_argument("--density", action="store_true",
+                    help="pack more VM's per host: a virtio memory balloon with free page reporting in every VM and KSM on the host")
+parser.add_argument("--ansible-profile", action="append", default=[], metavar="[PLAYBOOK=]PROFILE",
+                    help="ansible execution profile (standard or performance) for all playbooks, or for one playbook "
+                         "(bake, baseline, k8 or join) as PLAYBOOK=PROFILE - can be repeated (default: performance)")
+parser.add_argument("--tf-parallelism", type=int, default=0, metavar="N",
+                    help="terraform -parallelism for apply and destroy (default: 0 - every VM at once, at least 10)")
+parser.add_argument("--auto-approve", action="store_true",
+                    help="apply the terraform plan without asking for YES (unattended builds)")
+parser.add_argument("--ask-pass", action="store_true",
+                    help="authenticate ansible with the root password instead of the injected SSH key "
+                         "(the baseline image still needs cloud-init - it sets the static IP's)")
+parser.add_argument("--join-parallelism", type=int, default=0, metavar="N",
+                    help="join at most N workers at a time (default: 0 - all workers at once)")
+parser.add_argument("--force", action="store_true",
+                    help="apply main.tf and every playbook even if they did not change since their last successful apply")
+parser.add_argument("--resume", action="store_true",
+                    help="continue a failed build: phases recorded as finished whose result is still live are skipped")
+parser.add_argument("--report", metavar="FILE",
+                    help="write the run report to this file (default: " + LOG_DIR + "run-[date].json)")
+parser.add_argument("--teardown", action="store_true",
+                    help="destroy the VM's at the end of the build (used by benchmark)")
+parser.add_argument("--runs", type=int, default=3,
+                    help="benchmark: number of builds (default: 3)")
+parser.add_argument("--regression-threshold", type=float, default=10, metavar="PERCENT",
+                    help="benchmark: flag the total or a phase as a regression when it is this much slower than "
+                         "the median of the last " + str(BENCHMARK_BASELINE_RUNS) + " runs in the history (default: 10)")
+ARGS = parser.parse_args()
+if ARGS.resume and ARGS.command != "build":
+    parser.error("--resume only applies to build")
+
+for selection in ARGS.ansible_profile:
+    playbook, _, profile = selection.rpartition("=")
+    if profile not in ANSIBLE_CFG_FILES or (playbook and playbook not in ANSIBLE_PLAYBOOK_PROFILES):
+        parser.error("--ansible-profile " + selection + " is not valid")
+    for name in ([playbook] if playbook else ANSIBLE_PLAYBOOK_PROFILES):
+        ANSIBLE_PLAYBOOK_PROFILES[name] = profile
+
+for selection in ARGS.node_size:
+    role, _, size = selection.partition("=")
+    try:
+        vcpus, memory = [int(value) for value in size.split(":")]
+    except ValueError:
+        vcpus = memory = 0
+    if role not in ROLE_SIZES or vcpus < 1 or memory < 1024:
+        parser.error("--node-size " + selection + " is not valid")
+    ROLE_SIZES[role] = (vcpus, memory)
+
+for selection in ARGS.cpu_profile:
+    role, _, profile = selection.rpartition("=")
+    if profile not in CPU_PROFILES or (role and role not in ROLE_CPU_PROFILES):
+        parser.error("--cpu-profile " + selection + " is not valid")
+    for name in ([role] if role else ROLE_CPU_PROFILES):
+        ROLE_CPU_PROFILES[name] = profile
+
+for selection in ARGS.disk_profile:
+    role, _, profile = selection.rpartition("=")
+    if profile not in DISK_PROFILES or (role and role not in ROLE_DISK_PROFILES):
+        parser.error("--disk-profile " + selection + " is not valid")
+    for name in ([role] if role else ROLE_DISK_PROFILES):
+        ROLE_DISK_PROFILES[name] = profile
+
+for selection in ARGS.data_disk:
+    role, _, disk = selection.partition("=")
+    size, _, mount = disk.partition(":")
+    if role not in ROLE_SIZES or not size.isdigit() or int(size) < 1 or (mount and not mount.startswith("/")):
+        parser.error("--data-disk " + selection + " is not valid")
+    ROLE_DATA_DISKS[role] = (int(size), mount or DATA_DISK_MOUNT)
+
+for selection in ARGS.net_profile:
+    role, _, profile = selection.rpartition("=")
+    if profile not in NET_PROFILES or (role and role not in ROLE_NET_PROFILES):
+        parser.error("--net-profile " + selection + " is not valid")
+    for name in ([role] if role else ROLE_NET_PROFILES):
+        ROLE_NET_PROFILES[name] = profile
+
+if ARGS.local_storage:
+    if ARGS.logging_workers < 1:
+        parser.error("--local-storage needs at least one --logging-workers")
+    if ARGS.local_storage < LOCAL_STORAGE_MIN_GIB:
+        parser.error("--local-storage needs at least " + str(LOCAL_STORAGE_MIN_GIB) + " GiB - the size of the Elasticsearch claim")
+    if "logging" in ROLE_DATA_DISKS:
+        parser.error("--local-storage uses the logging data disk - remove --data-disk logging")
+    ROLE_DATA_DISKS["logging"] = (ARGS.local_storage, LOCAL_STORAGE_DIR)
+
+for selection in ARGS.nfs_class:
+    name, _, profile = selection.partition("=")
+    if profile not in NFS_MOUNT_PROFILES or not name.replace("-", "").isalnum() or name != name.lower() or name == LOCAL_STORAGE_CLASS:
+        parser.error("--nfs-class " + selection + " is not valid")
+    NFS_STORAGE_CLASSES[name] = profile
+
+# Pool volume {"pool", "size"} or host {"block_device"} of the etcd disk, None without --etcd-disk
+ETCD_DISK = None
+if ARGS.etcd_disk:
+    if ARGS.etcd_disk.startswith("/"):
+        ETCD_DISK = {"block_device": ARGS.etcd_disk}
+    else:
+        pool, _, size = ARGS.etcd_disk.partition(":")
+        if not pool or (size and (not size.isdigit() or int(size) < 1)):
+            parser.error("--etcd-disk " + ARGS.etcd_disk + " is not valid")
+        ETCD_DISK = {"pool": pool, "size": int(size or ETCD_DISK_SIZE)}
+    if ROLE_DATA_DISKS.get("control-plane", (0, ""))[1] == ETCD_DATA_DIR:
+        parser.error("--etcd-disk and --data-disk control-plane can not both be mounted at " + ETCD_DATA_DIR)
+    ETCD_EXTRA_ARGS.update(ETCD_DISK_ARGS)
+
+if ARGS.etcd_check and ARGS.ask_pass:
+    parser.error("--etcd-check runs over SSH with the injected key and can not be used with --ask-pass")
+
+for selection in ARGS.etcd_arg:
+    flag, _, value = selection.partition("=")
+    if not flag or flag.startswith("-") or not value:
+        parser.error("--etcd-arg " + selection + " is not valid")
+    ETCD_EXTRA_ARGS[flag] = value
+
+if ARGS.density and "pinned-hugepages" in ROLE_CPU_PROFILES.values():
+    parser.error("--density can not be used with --cpu-profile pinned-hugepages (hugepages are neither merged nor reported)")
+
+def build_topology(workers, ip_range):
+    # Returns {hostname: static IP} for one master and the requested number of workers
+    if workers < 1:
+        parser.error("--workers must be at least 1")
+    try:
+        first, last = [ipaddress.IPv4Address(ip.strip()) for ip in ip_range.split("-")]
+    except ValueError:
+        parser.error("--ip-range must look like 192.168.1.200-192.168.1.254")
+    hosts = ["master-001"] + ["worker-{:03d}".format(i) for i in range(1, workers + 1)]
+    if int(last) - int(first) + 1 < len(hosts):
+        parser.error(f"--ip-range {ip_range} has fewer than the {len(hosts)} IP's needed")
+    # cloud-init gives every node the NODE_GATEWAY route and the NODE_PREFIX netmask - the range has to be in that subnet
+    network = ipaddress.IPv4Interface(NODE_GATEWAY + "/" + str(NODE_PREFIX)).network
+    hosts_range = range(int(first), int(first) + len(hosts))
+    if first not in network or last not in network or first == network.network_address or last == network.broadcast_address:
+        parser.error(f"--ip-range {ip_range} is not inside {network}, the subnet of the {NODE_GATEWAY} gateway")
+    if int(ipaddress.IPv4Address(NODE_GATEWAY)) in hosts_range:
+        parser.error(f"--ip-range {ip_range} would assign the {NODE_GATEWAY} gateway to a node")
+    return {host: str(first + i) for i, host in enumerate(hosts)}
+
+# Static IP of every node, keyed by hostname
+NODE_IPS = build_topology(ARGS.workers, ARGS.ip_range)
+MASTER_IP = NODE_IPS["master-001"]
+
+def build_roles(hosts, logging_workers):
+    # Returns {hostname: role} - the master is the control plane and the last --logging-workers workers are logging workers
+    workers = [host for host in hosts if host.startswith("worker")]
+    if not 0 <= logging_workers <= len(workers):
+        parser.error("--logging-workers must be between 0 and --workers")
+    roles = {host: "worker" for host in workers}
+    roles.update({host: "logging" for host in workers[len(workers) - logging_workers:]})
+    roles["master-001"] = "control-plane"
+    return {host: roles[host] for host in hosts}
+
+# Role of every node, keyed by hostname
+NODE_ROLES = build_roles(NODE_IPS, ARGS.logging_workers)
+
 print("-----------------------------------------------------------------")
 def countdown(t):
     while t:
@@ -34,66 +478,147 @@ print("-----------------------------------------------------------------")
 # Execute script in order of functions defined here
 #--------------------------------------------------
 def main_function():
-    Terraform()
-    Ansible_Prep()
-    Ansible_Baseline()
-    Ansible_K8_Config()
-    Ansible_K8_Join()
-    Cleanup()
+    if ARGS.command == "benchmark":
+        Benchmark()
+        return
+    if ARGS.command == "disk-benchmark":
+        Disk_Benchmark()
+        return
+    if ARGS.command == "net-benchmark":
+        Net_Benchmark()
+        return
+    if ARGS.command == "storage-benchmark":
+        Storage_Benchmark()
+        return
+    if ARGS.command == "memory-report":
+        Memory_Report()
+        return
+    start = time.monotonic()
+    status = "failed"
+    try:
+        if ARGS.command == "mirror":
+            run_phase(Mirror_Setup)
+        else:
+            if ARGS.mirror and not port_open(ARGS.mirror, MIRROR_HTTP_PORT):
+                print("Mirror is not answering on " + ARGS.mirror + ":" + str(MIRROR_HTTP_PORT) + " - run: ./k8-create.py mirror... exiting")
+                exit(1)
+            if ARGS.command == "bake":
+                run_phase(Bake)
+            else:
+                phases = [Terraform, Ansible_Prep, Ansible_Baseline, Ansible_K8_Config, Ansible_K8_Join]
+                state, first = start_run_state(phases)
+                for phase in phases[first:]:
+                    run_phase(phase)
+                    checkpoint(state, phase.__name__, list(NODE_IPS))
+                if ARGS.teardown:
+                    run_phase(Teardown)
+                run_phase(Cleanup)
+        status = "succeeded"
+    finally:
+        write_run_report(status, time.monotonic() - start)
 
 #----------------------- START ANSIBLE-K8-JOIN ------------------------
 
 def Ansible_K8_Join():
     print("Writing Ansible Join Worker Node playbook")
 
+    # Cap on concurrent joins - every worker joins at once unless --join-parallelism is set
+    throttle = ""
+    if ARGS.join_parallelism > 0:
+        throttle = "    throttle: " + str(ARGS.join_parallelism) + "\n"
+
     join_playbook = open(HOME_DIR + "join_playbook.yaml", "w")
-    join_playbook.write('''- hosts: master-001 worker-001 worker-002
+    join_playbook.write('''- hosts: master-001
   become: true
+  gather_facts: false
   vars_files:
     - ./variables.yaml
   tasks:
 
-#---------------------------------> K8 CLUSTER INIT AND BASIC CONFIG
-
-  - name: Wait 1 minute before joining worker nodes
-    ansible.builtin.pause:
-      minutes: 1
+#---------------------------------> K8 BOOTSTRAP TOKEN
 
-  - name: Get kubeadm join command
-    command: kubeadm token create --print-join-command
+  - name: Create one bootstrap token and join command for every worker
+    command: kubeadm token create --ttl ''' + JOIN_TOKEN_TTL + ''' --print-join-command
     register: join_command
-    delegate_to: master-001
+
+- hosts: worker
+  become: true
+  vars_files:
+    - ./variables.yaml
+  tasks:
+
+#---------------------------------> K8 WORKER NODE JOIN
 
   - name: Execute join command
-    command: "{{ join_command.stdout }}" 
-    delegate_to: "{{ item }}"
-    loop: "{{ groups['worker'] }}"
+    command: "{{ hostvars['master-001'].join_command.stdout }}"
+    args:
+      creates: /etc/kubernetes/kubelet.conf
+''' + throttle + '''
+- hosts: master-001
+  become: true
+  gather_facts: false
+  vars:
+    node_roles: ''' + json.dumps(NODE_ROLES) + '''
+  tasks:
+
+#---------------------------------> K8 NODE ROLES
+
+  - name: Label every node with its role
+    command: ''' + KUBECTL + ''' label node {{ item.key }} ''' + NODE_ROLE_LABEL + '''={{ item.value }} --overwrite
+    loop: "{{ node_roles | dict2items }}"
 ''')
     join_playbook.close()
     print("Finished writing Ansible Join Worker Node playbook\n-----------------------------------------------------------------")
 
-    def run_ansible_playbook(playbook_path, inventory_path):
-        print("Applying K8 Join Worker Nodes playbook after authentication...")
-        command = ["ansible-playbook", "--user", "root", "--ask-pass", playbook_path]
-        if inventory_path:
-            command.extend(["-i", inventory_path])
-        try:
-            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = process.communicate()
-            return stdout.decode(), stderr.decode()
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            return None
     if __name__ == '__main__':
         playbook_path = HOME_DIR + "join_playbook.yaml"
         inventory_path = HOME_DIR + "inventory.ini"
-        output, error = run_ansible_playbook(playbook_path, inventory_path)
-        if output:
-            print("Standard Output:")
-            print(output)
-        if error:
-            print("Standard Error:")
-            print(error)
+
+        # Wait for the control plane instead of a fixed pause
+        print("Waiting for the master node kubelet and API server /readyz...")
+        wait_for_hosts(["master-001"], ["ssh", "kubelet", "apiserver", "readyz"], label="control-plane", ips=NODE_IPS)
+
+        # Workers with a running kubelet joined in an earlier run - only join the others
+        workers = [host for host in NODE_IPS if host.startswith("worker")]
+        pending = [host for host in workers if not (ARGS.resume and port_open(NODE_IPS[host], READY_PORTS["kubelet"]))]
+        if artifact_unchanged("join_playbook.yaml") and phase_is_live("Ansible_K8_Join", workers):
+            print("join_playbook.yaml unchanged since its last apply and every worker kubelet is up - skipping")
+            pending = []
+        elif pending:
+            print("Applying K8 Join Worker Nodes playbook...")
+            if run_ansible_playbook("join", playbook_path, inventory_path, limit=",".join(["master-001"] + pending)) != 0:
+                print("K8 Join Worker Nodes playbook failed - see the events log in " + LOG_DIR + " and rerun with --resume... exiting")
+                exit(1)
+            record_artifact("join_playbook.yaml")
+        else:
+            # Every worker joined in an earlier run that may have failed before its label play - only label the nodes
+            label_nodes()
+
+        print("Waiting for the worker node kubelets...")
+        wait_for_hosts(workers, ["kubelet"], label="join", ips=NODE_IPS)
+        print_join_times(pending)
+        print_readiness_times()
+        print_playbook_times()
+
+def label_nodes():
+    # Same labels as the last play of the join playbook - "--overwrite" makes it safe to repeat
+    print("Labelling every node with its role (" + NODE_ROLE_LABEL + ")...")
+    for host, role in NODE_ROLES.items():
+        result = kubectl_on_master("label node " + host + " " + NODE_ROLE_LABEL + "=" + role + " --overwrite")
+        if result.returncode != 0:
+            print("Labelling " + host + " failed: " + result.stderr.strip() + "... exiting")
+            exit(1)
+    print("-----------------------------------------------------------------")
+
+def print_join_times(workers):
+    # Join latency per worker: the join command from the playbook task times plus the kubelet start after it
+    print("Join latency per worker (seconds)")
+    for host in workers:
+        join = task_seconds("join", host, "Execute join command")
+        kubelet = READINESS_TIMES.get("join", {}).get(host, 0)
+        JOIN_TIMES[host] = {"join_command": join, "kubelet": kubelet, "total": round(join + kubelet, 1)}
+        print(f"  {host:<15}join {join:>8}  kubelet {kubelet:>8}  total {JOIN_TIMES[host]['total']:>8}")
+    print("-----------------------------------------------------------------")
 
 #------------------------ END ANSIBLE-K8-JOIN -------------------------
 
@@ -102,6 +627,21 @@ def Ansible_K8_Join():
 def Ansible_K8_Config():
     print("Writing Ansible K8 INIT and Configuration playbook")
 
+    if ARGS.mirror:
+        csi_manifests = [mirror_url("files/" + path) for path in MIRROR_FILES if path.startswith("csi-driver-nfs/")]
+        network_tasks = '''  - name: Install flannel pod network
+    shell: kubectl apply -f ''' + mirror_url("files/kube-flannel.yml") + '''
+
+  - name: Install NFS CSI
+    shell: kubectl apply -f ''' + " -f ".join(csi_manifests) + "\n"
+    else:
+        network_tasks = '''  - name: Install flannel pod network
+    shell: kubectl apply -f https://github.com/flannel-io/flannel/releases/latest/download/kube-flannel.yml
+
+  - name: Install NFS CSI
+    shell: curl -skSL https://raw.githubusercontent.com/kubernetes-csi/csi-driver-nfs/''' + CSI_NFS_VERSION + '''/deploy/install-driver.sh | bash -s ''' + CSI_NFS_VERSION + ''' --
+'''
+
     k8_playbook = open(HOME_DIR + "k8_playbook.yaml", "w")
     k8_playbook.write('''- hosts: master-001
   become: true
@@ -111,8 +651,21 @@ def Ansible_K8_Config():
 
 #---------------------------------> K8 CLUSTER INIT AND BASIC CONFIG
 
+  - name: Get the kubeadm version
+    command: kubeadm version -o short
+    register: kubeadm_version
+    changed_when: false
+
+  - name: Write the kubeadm configuration
+    ansible.builtin.copy:
+      dest: /etc/kubernetes/kubeadm-config.yaml
+      mode: '0600'
+      content: |
+''' + kubeadm_config() + '''
   - name: Initialize K8 Cluster
-    shell: kubeadm init --apiserver-advertise-address 192.168.1.200 --control-plane-endpoint 192.168.1.200 --pod-network-cidr=10.244.0.0/16
+    command: kubeadm init --config /etc/kubernetes/kubeadm-config.yaml
+    args:
+      creates: /etc/kubernetes/admin.conf
 
   - name: Add export to root profile
     lineinfile:
@@ -122,195 +675,304 @@ def Ansible_K8_Config():
   - name: Source the root profile
     shell: source ~/.bashrc
 
-  - name: Install flannel pod network
-    shell: kubectl apply -f https://github.com/flannel-io/flannel/releases/latest/download/kube-flannel.yml
+''' + network_tasks + '''
 
-  - name: Install NFS CSI
-    shell: curl -skSL https://raw.githubusercontent.com/kubernetes-csi/csi-driver-nfs/v4.11.0/deploy/install-driver.sh | bash -s v4.11.0 --
+''' + nfs_storage_class_tasks() + local_storage_tasks())
+    k8_playbook.close()
+    print("Finished writing Ansible K8 INIT and Configuration playbook\n-----------------------------------------------------------------")
 
-  - name: Deploy StorageClass on master node
+
+    if __name__ == '__main__':
+        playbook_path = HOME_DIR + "k8_playbook.yaml"
+        inventory_path = HOME_DIR + "inventory.ini"
+
+        if artifact_unchanged("k8_playbook.yaml") and phase_is_live("Ansible_K8_Config", list(NODE_IPS)):
+            print("k8_playbook.yaml unchanged since its last apply and the API server is ready - skipping")
+            return
+        if ARGS.etcd_check and not apiserver_ready(MASTER_IP):
+            etcd_fsync_preflight()
+        print("Applying K8 INIT and Configurations playbook...")
+        if run_ansible_playbook("k8", playbook_path, inventory_path) != 0:
+            print("K8 INIT and Configurations playbook failed - see the events log in " + LOG_DIR + " and rerun with --resume... exiting")
+            exit(1)
+        record_artifact("k8_playbook.yaml")
+        print(f"kubeadm init finished in {task_seconds('k8', 'master-001', 'Initialize K8 Cluster')}s")
+        print("-----------------------------------------------------------------")
+        if ARGS.etcd_check:
+            etcd_check_perf()
+
+def etcd_extra_args():
+    # extraArgs of the local etcd - left out of the ClusterConfiguration without --etcd-disk or --etcd-arg
+    if not ETCD_EXTRA_ARGS:
+        return ""
+    return "            extraArgs:\n" + "".join('              ' + flag + ': "' + value + '"\n' for flag, value in ETCD_EXTRA_ARGS.items())
+
+def kubeadm_config():
+    # InitConfiguration, ClusterConfiguration and KubeletConfiguration for kubeadm init, indented for a copy task
+    # The kubernetes version is templated from the installed kubeadm so init never looks it up online
+    return '''        apiVersion: kubeadm.k8s.io/v1beta3
+        kind: InitConfiguration
+        localAPIEndpoint:
+          advertiseAddress: ''' + MASTER_IP + '''
+          bindPort: ''' + str(READY_PORTS["apiserver"]) + '''
+        nodeRegistration:
+          criSocket: ''' + CRI_SOCKET + '''
+        ---
+        apiVersion: kubeadm.k8s.io/v1beta3
+        kind: ClusterConfiguration
+        kubernetesVersion: "{{ kubeadm_version.stdout }}"
+        controlPlaneEndpoint: ''' + MASTER_IP + ":" + str(READY_PORTS["apiserver"]) + '''
+        networking:
+          podSubnet: ''' + POD_NETWORK_CIDR + '''
+        etcd:
+          local:
+            dataDir: ''' + ETCD_DATA_DIR + '''
+''' + etcd_extra_args() + '''        ---
+        apiVersion: kubelet.config.k8s.io/v1beta1
+        kind: KubeletConfiguration
+        cgroupDriver: systemd
+'''
+
+def nfs_storage_class_tasks():
+    # One StorageClass per --nfs-class with the mount options of its profile. The mount options of a StorageClass can
+    # not be updated - a class whose options changed is deleted and created again (existing PV's keep their options)
+    tasks = ""
+    for name, profile in NFS_STORAGE_CLASSES.items():
+        mount_options = NFS_MOUNT_PROFILES[profile]
+        # The default profile has no options - the class leaves mountOptions out and the client negotiates
+        mount_options_yaml = ""
+        if mount_options:
+            mount_options_yaml = "        mountOptions:\n" + "".join("          - " + option + "\n" for option in mount_options)
+        default_class = ""
+        if name == "nfs-csi":
+            default_class = '''
+          annotations:
+            storageclass.kubernetes.io/is-default-class: "true"'''
+        tasks += '''
+  - name: Read the mount options of the ''' + name + ''' StorageClass
+    command: ''' + KUBECTL + ''' get storageclass ''' + name + ''' -o jsonpath={.mountOptions}
+    register: mount_options
+    failed_when: false
+    changed_when: false
+
+  - name: Delete the ''' + name + ''' StorageClass when its mount options changed
+    command: ''' + KUBECTL + ''' delete storageclass ''' + name + '''
+    when: mount_options.rc == 0 and mount_options.stdout != ''' + "'" + (json.dumps(mount_options, separators=(",", ":")) if mount_options else "") + "'" + '''
+
+  - name: Deploy the ''' + name + ''' StorageClass (''' + profile + ''' mount options)
     community.kubernetes.k8s:
       state: present
       resource_definition:
         apiVersion: storage.k8s.io/v1
         kind: StorageClass
         metadata:
-          name: nfs-csi
-          annotations:
-            storageclass.kubernetes.io/is-default-class: "true"
+          name: ''' + name + default_class + '''
         provisioner: nfs.csi.k8s.io
         parameters:
-          server: 192.168.1.99
-          share: /mnt/usb_drive
+          server: ''' + NFS_SERVER + '''
+          share: ''' + NFS_SHARE + '''
         reclaimPolicy: Delete
         volumeBindingMode: Immediate
-        mountOptions:
-          - nfsvers=4
-''')
-    k8_playbook.close()
-    print("Finished writing Ansible K8 INIT and Configuration playbook\n-----------------------------------------------------------------")
-    
-    print("\nWaiting for VM's to reboot...\n")
-    time.sleep(90)
-
+''' + mount_options_yaml
+    return tasks
+
+def local_storage_tasks():
+    # StorageClass and one static PV per logging worker on its data disk - a PVC binds when its pod is scheduled, to
+    # the PV of the node the pod landed on (WaitForFirstConsumer)
+    if not ARGS.local_storage:
+        return ""
+    tasks = '''
+  - name: Deploy the node-local StorageClass
+    community.kubernetes.k8s:
+      state: present
+      resource_definition:
+        apiVersion: storage.k8s.io/v1
+        kind: StorageClass
+        metadata:
+          name: ''' + LOCAL_STORAGE_CLASS + '''
+        provisioner: kubernetes.io/no-provisioner
+        reclaimPolicy: Retain
+        volumeBindingMode: WaitForFirstConsumer
+'''
+    for host, role in NODE_ROLES.items():
+        if role == "logging":
+            tasks += '''
+  - name: Deploy the local PersistentVolume of ''' + host + '''
+    community.kubernetes.k8s:
+      state: present
+      resource_definition:
+        apiVersion: v1
+        kind: PersistentVolume
+        metadata:
+          name: local-pv-''' + host + '''
+        spec:
+          capacity:
+            storage: ''' + str(ARGS.local_storage) + '''Gi
+          accessModes:
+            - ReadWriteOnce
+          persistentVolumeReclaimPolicy: Retain
+          storageClassName: ''' + LOCAL_STORAGE_CLASS + '''
+          local:
+            path: ''' + LOCAL_STORAGE_DIR + '''
+          nodeAffinity:
+            required:
+              nodeSelectorTerms:
+                - matchExpressions:
+                    - key: kubernetes.io/hostname
+                      operator: In
+                      values:
+                        - ''' + host + '''
+'''
+    return tasks
+
+def etcd_fsync_preflight():
+    # etcd syncs every write of its WAL - measures that pattern (fio fdatasync) on the etcd data directory before init
+    print("etcd disk preflight: fio fdatasync on " + ETCD_DATA_DIR + " (" + str(FIO_RUNTIME) + "s)...")
+    result = run_fio(MASTER_IP, "fdatasync", ETCD_DATA_DIR)
+    ETCD_CHECK["fdatasync"] = result
+    print(f"  fdatasync p99 {result['p99_ms']} ms, {result['iops']} IOPS")
+    if result["p99_ms"] > ETCD_FSYNC_P99_LIMIT_MS:
+        print(f"  WARNING: above the {ETCD_FSYNC_P99_LIMIT_MS} ms etcd needs - expect a slow API server (see --etcd-disk)")
     print("-----------------------------------------------------------------")
-    print("Creating new inventory file")
-    # Remove the previous inventory file and re-write using new IP addresses
-    p1 = pathlib.Path(HOME_DIR + "inventory.ini")
-    p1.unlink(missing_ok=True)
-
-    hosts = ["master-001", "worker-001", "worker-002"]
-    ansible_inv = open(HOME_DIR + "inventory.ini", "w")
-
-    # Execute virsh command to obtain dirty IP list
-    for host in hosts:
-        virsh_cmd = subprocess.run(["virsh", "domifaddr", host, "--source", "agent"], capture_output=True, text=True)
-
-        # Clean up raw input from virsh execution
-        if virsh_cmd.returncode == 0:
-            virsh_output = virsh_cmd.stdout
-            string_split = virsh_output.strip().split('\n')
-
-            for line in string_split:
-            # Regular expression to find valid IPv4 addresses and omit loopback
-                ip_match = re.search(r'\b(?:(?!127\.0\.0\.1)(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\b', line)
-
-                # Change group match to string and write to ini file
-                if ip_match:
-                    ip = ip_match.group()
-                    if host == "master-001":
-                        ansible_inv.write("[master]\n")
-                    if host == "worker-001":
-                        ansible_inv.write("[worker]\n")
-                    ansible_inv.write(host + " ansible_host=" + ip + "\n")
-        else:
-            print(f"Command failed with error code {virsh_cmd.returncode}: {virsh_cmd.stderr}")
-    ansible_inv.close()
-    print("Completed writing new inventory file\n-----------------------------------------------------------------")
 
-    def run_ansible_playbook(playbook_path, inventory_path):
-        print("Applying K8 INIT and Configurations playbook after authentication...")
-        command = ["ansible-playbook", "--user", "root", "--ask-pass", playbook_path]
-
-        if inventory_path:
-            command.extend(["-i", inventory_path])
-        try:
-            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = process.communicate()
-            return stdout.decode(), stderr.decode()
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            return None
-
-    if __name__ == '__main__':
-        playbook_path = HOME_DIR + "k8_playbook.yaml"
-        inventory_path = HOME_DIR + "inventory.ini"
-
-        output, error = run_ansible_playbook(playbook_path, inventory_path)
-
-        if output:
-            print("Standard Output:")
-            print(output)
-        if error:
-            print("Standard Error:")
-            print(error)
+def etcd_check_perf():
+    # "etcdctl check perf" puts a write load on the new etcd member for about a minute and checks throughput and latency
+    print("Running etcdctl check perf in etcd-master-001...")
+    result = kubectl_on_master("-n kube-system exec etcd-master-001 -- etcdctl --endpoints=https://127.0.0.1:2379 "
+                               "--cacert=/etc/kubernetes/pki/etcd/ca.crt --cert=/etc/kubernetes/pki/etcd/server.crt "
+                               "--key=/etc/kubernetes/pki/etcd/server.key check perf")
+    output = (result.stdout + result.stderr).strip()
+    ETCD_CHECK["check_perf"] = {"passed": result.returncode == 0, "output": output.splitlines()}
+    for line in output.splitlines():
+        print("  " + line)
+    if result.returncode != 0:
+        print("  WARNING: etcdctl check perf did not pass - the etcd disk is too slow for the load")
+    print("-----------------------------------------------------------------")
 
 #----------------------- END ANSIBLE-K8-CONFIG ------------------------
 
 #----------------------- START ANSIBLE-BASELINE -----------------------
 
-def Ansible_Baseline():
-    print("Writing Ansible BASELINE playbook")
-    baseline_playbook = open(HOME_DIR + "baseline_playbook.yaml", "w")
-    baseline_playbook.write('''- hosts: master-001 worker-001 worker-002
-  become: true
-  vars_files:
-    - ./variables.yaml
-  tasks:
+def baseline_bake_tasks():
+    # Node-agnostic baseline tasks - baked once into the golden image, or applied to every node
+    # when building from the plain baseline image
+    repo_urls = {name: mirror_url(name + "/") if ARGS.mirror else url for name, url in RPM_REPOS.items()}
+    base_packages = "".join("        - " + package + "\n" for package in BASE_PACKAGES)
+    pip_packages = "".join("        - " + package + "\n" for package in PIP_PACKAGES)
+    dnf_options = ""
+    mirror_repo_tasks = ""
+    mirror_registry_tasks = ""
+    pip_options = ""
+    helm_tasks = '''  - name: Download Helm installation script
+    ansible.builtin.get_url:
+      url: https://raw.githubusercontent.com/helm/helm/master/scripts/get-helm-3
+      dest: /tmp/get_helm.sh
+      mode: '0755'
 
-#---------------------------------> ENABLE REPO'S
+  - name: Run Helm installation script
+    command: /tmp/get_helm.sh
+    args:
+      creates: /usr/local/bin/helm
+    register: helm_install_result
+    changed_when: false
+'''
+
+    # Everything comes from the mirror - no other repo's are needed, so none are queried
+    if ARGS.mirror:
+        dnf_options = '''      disablerepo: "*"
+      enablerepo: ''' + ",".join(list(RPM_REPOS) + ["k8-base"]) + "\n"
+        mirror_repo_tasks = '''
+  - name: Add mirrored base packages repo
+    yum_repository:
+      name: k8-base
+      description: Base packages for K8-on-KVM from the local mirror
+      baseurl: "''' + mirror_url("k8-base/") + '''"
+      gpgcheck: yes
+      gpgkey: file:///etc/pki/rpm-gpg/RPM-GPG-KEY-oracle
+'''
+        registries = ""
+        for registry, (remote_url, port) in MIRROR_REGISTRIES.items():
+            registries += '''        [[registry]]
+        prefix = "''' + registry + '''"
+        location = "''' + registry + '''"
+        [[registry.mirror]]
+        location = "''' + ARGS.mirror + ":" + str(port) + '''"
+        insecure = true
+
+'''
+        mirror_registry_tasks = '''
+  - name: Point CRI-O at the local registry mirrors
+    ansible.builtin.copy:
+      dest: /etc/containers/registries.conf.d/99-k8-mirror.conf
+      mode: '0644'
+      content: |
+''' + registries.rstrip() + "\n"
+        pip_options = "      extra_args: --no-index --find-links " + mirror_url("pip/") + "\n"
+        helm_tasks = '''  - name: Install Helm from the local mirror
+    ansible.builtin.unarchive:
+      src: ''' + mirror_url("files/helm-linux-amd64.tar.gz") + '''
+      dest: /usr/local/bin
+      remote_src: yes
+      extra_opts: [--strip-components=1, --wildcards, '*/helm']
+    register: helm_install_result
+'''
+
+    return '''#---------------------------------> ENABLE REPO'S
 
   - name: Add kubernetes repo
     yum_repository:
       name: kubernetes
       description: Repo for K8-on-KVM
-      baseurl: "https://pkgs.k8s.io/core:/stable:/v1.28/rpm/"
+      baseurl: "''' + repo_urls["kubernetes"] + '''"
       gpgcheck: yes
-      gpgkey: https://pkgs.k8s.io/core:/stable:/v1.28/rpm/repodata/repomd.xml.key
+      gpgkey: ''' + repo_urls["kubernetes"] + '''repodata/repomd.xml.key
 
   - name: Add CRI-O repo
     yum_repository:
       name: cri-o
       description: Repo for K8-on-KVM
-      baseurl: "https://pkgs.k8s.io/addons:/cri-o:/prerelease:/main/rpm/"
+      baseurl: "''' + repo_urls["cri-o"] + '''"
       gpgcheck: yes
-      gpgkey: https://pkgs.k8s.io/addons:/cri-o:/prerelease:/main/rpm/repodata/repomd.xml.key
-
+      gpgkey: ''' + repo_urls["cri-o"] + '''repodata/repomd.xml.key
+''' + mirror_repo_tasks + '''
 #---------------------------------> INSTALL SOFTWARE
 
   - name: Install K8 Binaries
     ansible.builtin.dnf:
       name: "{{ packages }}"
-    vars:
+''' + dnf_options + '''    vars:
       packages:
         - kubeadm
         - kubectl
         - kubelet
       state: present
 
-  - name: Download Helm installation script
-    ansible.builtin.get_url:
-      url: https://raw.githubusercontent.com/helm/helm/master/scripts/get-helm-3
-      dest: /tmp/get_helm.sh
-      mode: '0755'
-    delegate_to: master-001
-
-  - name: Run Helm installation script
-    command: /tmp/get_helm.sh
-    args:
-      creates: /usr/local/bin/helm
-    register: helm_install_result
-    changed_when: false
-    delegate_to: master-001
-
+''' + helm_tasks + '''
   - name: Add /usr/local/bin to PATH
     lineinfile:
       path: ~/.bashrc
       line: 'export PATH=$PATH:/usr/local/bin'
-    when: helm_install_result.rc == 0
-    delegate_to: master-001
+    when: helm_install_result is succeeded
 
   - name: Install CRI-O
     ansible.builtin.dnf:
       name: "{{ packages }}"
-    vars:
+''' + dnf_options + '''    vars:
       packages:
         - cri-o
       state: present
-
+''' + mirror_registry_tasks + '''
   - name: Install Base Packages for Kubernestes Functionality
     ansible.builtin.dnf:
       name: "{{ packages }}"
-    vars:
+''' + dnf_options + '''    vars:
       packages:
-        - conntrack
-        - container-selinux
-        - ebtables
-        - ethtool
-        - iptables
-        - socat
-        - nfs-utils
-        - dhcp-client
-        - pip
-      state: present
+''' + base_packages + '''      state: present
 
   - name: Install Base Packages for Ansible / K8 ability to deploy
     pip:
       name:
-        - openshift
-        - pyyaml
-    delegate_to: master-001
-
+''' + pip_packages + pip_options + '''
   - name: Enable mountd Service
     ansible.posix.firewalld:
       service: mountd
@@ -321,15 +983,6 @@ def Ansible_Baseline():
 
 #---------------------------------> MAKE CONFIGURATIONS
 
-  - name: Add k8 nodes to /etc/hosts
-    ansible.builtin.lineinfile:
-      dest: /etc/hosts
-      line: "{{ item.line }}"
-    loop:
-      - { line: '192.168.1.200 master-001 master-001' }
-      - { line: '192.168.1.201 worker-001 worker-001' }
-      - { line: '192.168.1.202 worker-002 worker-002' }
-
   - name: Disable swap
     shell: swapoff -a
 
@@ -397,90 +1050,132 @@ def Ansible_Baseline():
       state: stopped
       enabled: no
 
-  - name: Set hostname
-    hostname:
-      name: "{{ inventory_hostname }}"
+  - name: Enable weekly fstrim so freed blocks are returned to the pool on discard enabled disks
+    ansible.builtin.systemd_service:
+      name: fstrim.timer
+      state: started
+      enabled: true
 
   - name: Create mount point
     ansible.builtin.file:
-      path: /mnt/usb_drive
+      path: ''' + NFS_SHARE + '''
       state: directory
       mode: 0755
+'''
+
+def Ansible_Baseline():
+    # The golden image already carries the node-agnostic tasks - only per node settings are left
+    if golden_image_in_use():
+        print("Writing Ansible BASELINE playbook (per node settings only - building from the golden image)")
+        bake_tasks = ""
+    else:
+        print("Writing Ansible BASELINE playbook")
+        bake_tasks = baseline_bake_tasks()
+    baseline_playbook = open(HOME_DIR + "baseline_playbook.yaml", "w")
+    # /etc/hosts entries for every node
+    hosts_entries = ""
+    for host, ip in NODE_IPS.items():
+        hosts_entries += "      - { line: '" + ip + " " + host + " " + host + "' }\n"
+
+    # Device and mount point of the data and etcd disks of every node that has them
+    extra_disks = {host: node_disks(host) for host in NODE_IPS if node_disks(host)}
+    # Nodes whose interface has a queue pair per vCPU
+    net_multiqueue = [host for host, role in NODE_ROLES.items() if ROLE_NET_PROFILES[role] == "multiqueue"]
+
+    baseline_playbook.write('''- hosts: master:worker
+  become: true
+  vars_files:
+    - ./variables.yaml
+  vars:
+    extra_disks: ''' + json.dumps(extra_disks) + '''
+    net_multiqueue: ''' + json.dumps(net_multiqueue) + '''
+  tasks:
 
-  - name: Mount NFS share
+''' + bake_tasks + '''
+#---------------------------------> PER NODE CONFIGURATIONS
+
+  - name: Add k8 nodes to /etc/hosts
+    ansible.builtin.lineinfile:
+      dest: /etc/hosts
+      line: "{{ item.line }}"
+    loop:
+''' + hosts_entries + '''
+  - name: Mount NFS share (''' + ARGS.nfs_mount_profile + ''' mount options)
     ansible.posix.mount:
-        path: /mnt/usb_drive
-        src: 192.168.1.99:/mnt/usb_drive
+        path: ''' + NFS_SHARE + '''
+        src: ''' + NFS_SERVER + ":" + NFS_SHARE + '''
         fstype: nfs
         state: mounted
-        opts: defaults,rw
-
-  - name: Pause for 1 minute for worker nodes to join successfully
-    ansible.builtin.pause:
-      minutes: 1
-
-  - name: Add an Ethernet connection with static IP configuration
-    community.general.nmcli:
-      conn_name: ethernet
-      ifname: ens3
-      type: ethernet
-      ip4: "{{ new_ip }}"
-      dns4:
-          - 192.168.1.1
-      gw4: 192.168.1.1
-      state: present
-
-  - name: Release the DHCP Address and reboot without waiting for reboot to complete
-    shell: "dhclient -r && reboot"
-    async: 1
-    poll: 0    
-''')
-    baseline_playbook.close()
+        opts: ''' + ",".join(["defaults", "rw"] + NFS_MOUNT_PROFILES[ARGS.nfs_mount_profile]) + '''
 
-    # Create variable dir and files necessary for static IP assignment of VM's 
-    host_vars_dir = os.mkdir(HOME_DIR + "host_vars")
-    host_vars_path = HOME_DIR + "host_vars"
+  - name: Create the filesystem on the data and etcd disks
+    community.general.filesystem:
+      fstype: xfs
+      dev: "{{ item.device }}"
+    loop: "{{ extra_disks[inventory_hostname] | default([]) }}"
 
-    master001 = open(host_vars_path + "/master-001", "w")
-    master001.write("new_ip: 192.168.1.200/24")
-    master001.close()
+  - name: Mount the data and etcd disks
+    ansible.posix.mount:
+      path: "{{ item.mount }}"
+      src: "{{ item.device }}"
+      fstype: xfs
+      opts: defaults,noatime
+      state: mounted
+    loop: "{{ extra_disks[inventory_hostname] | default([]) }}"
+
+  - name: Write the interface queue script (multiqueue, RPS/RFS and XPS)
+    ansible.builtin.copy:
+      dest: /usr/local/sbin/k8-net-queues.sh
+      mode: '0755'
+      content: |
+''' + net_queues_script() + '''    when: inventory_hostname in net_multiqueue
+
+  - name: Write the interface queue service
+    ansible.builtin.copy:
+      dest: /etc/systemd/system/k8-net-queues.service
+      mode: '0644'
+      content: |
+        [Unit]
+        Description=Spread the interface queues over every vCPU
+        Wants=network-online.target
+        After=network-online.target
+
+        [Service]
+        Type=oneshot
+        RemainAfterExit=yes
+        ExecStart=/usr/local/sbin/k8-net-queues.sh
+
+        [Install]
+        WantedBy=multi-user.target
+    when: inventory_hostname in net_multiqueue
+
+  - name: Enable and apply the interface queue service
+    ansible.builtin.systemd_service:
+      name: k8-net-queues
+      state: restarted
+      enabled: true
+      daemon_reload: true
+    when: inventory_hostname in net_multiqueue
 
-    worker001 = open(host_vars_path + "/worker-001", "w")
-    worker001.write("new_ip: 192.168.1.201/24")
-    worker001.close()
-    
-    worker002 = open(host_vars_path + "/worker-002", "w")
-    worker002.write("new_ip: 192.168.1.202/24")
-    worker002.close()
+  - name: Pre-pull the kubeadm images so init and join don't wait on the registry
+    shell: kubeadm config images pull --kubernetes-version "$(kubeadm version -o short)" --cri-socket ''' + CRI_SOCKET + '''
+''')
+    baseline_playbook.close()
 
     print("Completed writing Ansible BASELINE playbook\n-----------------------------------------------------------------")
 
-    def run_ansible_playbook(playbook_path, inventory_path):
-        print("Applying BASELINE Configuration playbook after authentication...")
-        command = ["ansible-playbook", "--user", "root", "--ask-pass", playbook_path]
-
-        if inventory_path:
-            command.extend(["-i", inventory_path])
-        try:
-            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = process.communicate()
-            return stdout.decode(), stderr.decode()
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            return None
-    
     if __name__ == '__main__':
         playbook_path = HOME_DIR + "baseline_playbook.yaml"
         inventory_path = HOME_DIR + "inventory.ini"
     
-        output, error = run_ansible_playbook(playbook_path, inventory_path)
-    
-        if output:
-            print("Standard Output:")
-            print(output)
-        if error:
-            print("Standard Error:")
-            print(error)
+        if artifact_unchanged("baseline_playbook.yaml") and phase_is_live("Ansible_Baseline", list(NODE_IPS)):
+            print("baseline_playbook.yaml unchanged since its last apply and every node answers on SSH - skipping")
+            return
+        print("Applying BASELINE Configuration playbook...")
+        if run_ansible_playbook("baseline", playbook_path, inventory_path) != 0:
+            print("BASELINE Configuration playbook failed - see the events log in " + LOG_DIR + " and rerun with --resume... exiting")
+            exit(1)
+        record_artifact("baseline_playbook.yaml")
 
 
 #----------------------- STOP ANSIBLE-BASELINE -----------------------
@@ -488,47 +1183,51 @@ def Ansible_Baseline():
 #----------------------- START ANSIBLE-PREP -----------------------
 
 def Ansible_Prep():
-    print(f"\nWaiting 1 minute for VM's to obtain an IP Addresses...\n")
-    time.sleep(60)
-
-    # Execute the virsh command on each host and write to the inventory file
+    # The static IP's are set by cloud-init at first boot - the inventory is known up front
     print("-----------------------------------------------------------------")
     print("Creating inventory file")
-    hosts = ["master-001", "worker-001", "worker-002"]
-    ansible_inv = open(HOME_DIR + "inventory.ini", "w")
-
-    # Execute virsh command to obtain dirty IP list
-    for host in hosts:
-        virsh_cmd = subprocess.run(["virsh", "domifaddr", host, "--source", "agent"], capture_output=True, text=True)
-    
-        # Clean up raw input from virsh execution
-        if virsh_cmd.returncode == 0:
-            virsh_output = virsh_cmd.stdout
-            string_split = virsh_output.strip().split('\n')
-
-            for line in string_split:
-                # Regular expression to find valid IPv4 addresses and omit loopback
-                ip_match = re.search(r'\b(?:(?!127\.0\.0\.1)(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\b', line)
-                
-                # Change group match to string and write to ini file
-                if ip_match:
-                    ip = ip_match.group()
-                    ansible_inv.write(host + " ansible_host=" + ip + "\n")
-        else:
-            print(f"Command failed with error code {virsh_cmd.returncode}: {virsh_cmd.stderr}")
-    ansible_inv.close()
+    write_inventory(NODE_IPS)
     print("Completed writing inventory file\n-----------------------------------------------------------------")
 
-    # Create ansible config file
-    print("Creating Ansible Configuration file")
-    ansible_cfg = open(HOME_DIR + "ansible.cfg", "w")
-    ansible_cfg.write('''[defaults]
+    # Create ansible config files - one per execution profile
+    print("Creating Ansible Configuration files")
+    write_ansible_cfgs(HOME_DIR)
+    print ("Completed writing Ansible Configuration files\n-----------------------------------------------------------------")
+
+    print("\nWaiting for VM's to start SSH on their static IP's...\n")
+    wait_for_hosts(list(NODE_IPS), ["ssh"], label="boot", ips=NODE_IPS)
+
+def write_ansible_cfgs(cfg_dir):
+    # standard:     default ansible behaviour - a new SSH connection and module transfer per task, linear strategy
+    # performance:  SSH pipelining and persistent connections, free strategy (plays that need task order set
+    #               "strategy: linear" themselves) and facts gathered once per host into a JSON file cache
+    defaults = '''[defaults]
 host_key_checking = False
 deprecation_warnings = False
 interpreter_python = auto_silent
-ansible_connection_timeout = 5''')
+ansible_connection_timeout = 5
+forks = ''' + str(max(5, len(NODE_IPS))) + '''
+callback_plugins = ''' + cfg_dir + '''callback_plugins
+stdout_callback = k8_events
+'''
+    write_callback_plugin(cfg_dir + "callback_plugins/")
+
+    ansible_cfg = open(cfg_dir + ANSIBLE_CFG_FILES["standard"], "w")
+    ansible_cfg.write(defaults)
+    ansible_cfg.close()
+
+    ansible_cfg = open(cfg_dir + ANSIBLE_CFG_FILES["performance"], "w")
+    ansible_cfg.write(defaults + '''strategy = free
+gathering = smart
+fact_caching = jsonfile
+fact_caching_connection = ''' + cfg_dir + '''.ansible-facts
+fact_caching_timeout = 7200
+
+[ssh_connection]
+pipelining = True
+ssh_args = -o ControlMaster=auto -o ControlPersist=120s
+''')
     ansible_cfg.close()
-    print ("Completed writing Ansible Configuration file\n-----------------------------------------------------------------")
     
 #---------------------- END ANSIBLE-PREP -----------------------
 
@@ -538,48 +1237,147 @@ def Terraform():
     print("Checking if BASELINE image exists...")
     # Baseline VM created and disk located under mounted path 
     try:
-        with open("/mnt/usb_drive/kvm/disk/ol9-kvm-baseline.qcow2", "r") as f:
+        with open(BASELINE_IMAGE, "r"):
             print("Baseline qcow2 file exists... continuing\n-----------------------------------------------------------------")
             
     except FileNotFoundError:
         print("Basline qcow file NOT found... exiting")
         exit()
 
+    source_image = BASELINE_IMAGE
+    if golden_image_in_use():
+        source_image = golden_image_path()
+        print("Golden image found - cloning from: " + source_image + "\n-----------------------------------------------------------------")
+    elif not ARGS.no_golden and other_golden_images():
+        # The bake tasks carry the mirror address - a golden image baked with another --mirror is not reused
+        print("WARNING: " + ", ".join(other_golden_images()) + " does not match this build (baked with another --mirror or "
+              "from an older baseline image) - building from the baseline image. Run \"./k8-create.py bake\" with the same --mirror "
+              "to bake a matching golden image\n-----------------------------------------------------------------")
+
+    # Linked clones import the baseline once and give each VM a thin overlay backed by it
+    if ARGS.clone_mode == "linked":
+        volume_config = '''resource "libvirt_volume" "ol9-kvm-base" {
+  name = "ol9-kvm-base.qcow2"
+  pool = "disk"
+  source = "''' + source_image + '''"
+  format = "qcow2"
+}
+resource "libvirt_volume" "ol9-kvm-baseline" {
+  for_each = local.host_list
+  name = "${each.key}.qcow2"
+  pool = "disk"
+  base_volume_id = libvirt_volume.ol9-kvm-base.id
+  format = "qcow2"
+}'''
+    else:
+        volume_config = '''resource "libvirt_volume" "ol9-kvm-baseline" {
+  for_each = local.host_list
+  name = "${each.key}.qcow2"
+  pool = "disk"
+  source = "''' + source_image + '''"
+  format = "qcow2"
+}'''
+    volume_config += '''
+resource "libvirt_volume" "ol9-kvm-data" {
+  for_each = local.data_disks
+  name = "${each.key}-data.qcow2"
+  pool = "disk"
+  size = each.value
+  format = "qcow2"
+}'''
+
+    ensure_ssh_key()
+
+    # The etcd disk of the control plane - a volume in its own pool or a host block device
+    etcd_volume_config = ""
+    etcd_disk_config = ""
+    if ETCD_DISK and "pool" in ETCD_DISK:
+        if run_command(["virsh", "pool-info", ETCD_DISK["pool"]], capture_output=True).returncode != 0:
+            print("--etcd-disk storage pool " + ETCD_DISK["pool"] + " not found (virsh pool-list --all)... exiting")
+            exit(1)
+        etcd_volume_config = '''
+resource "libvirt_volume" "ol9-kvm-etcd" {
+  name = "master-001-etcd.qcow2"
+  pool = "''' + ETCD_DISK["pool"] + '''"
+  size = ''' + str(ETCD_DISK["size"] * 1024 ** 3) + '''
+  format = "qcow2"
+}'''
+        etcd_disk_config = "volume_id = libvirt_volume.ol9-kvm-etcd.id"
+    elif ETCD_DISK:
+        if not os.path.exists(ETCD_DISK["block_device"]):
+            print("--etcd-disk block device " + ETCD_DISK["block_device"] + " not found... exiting")
+            exit(1)
+        etcd_disk_config = 'block_device = "' + ETCD_DISK["block_device"] + '"'
+    if etcd_disk_config:
+        etcd_disk_config = '''
+  dynamic "disk" {
+    for_each = each.key == "master-001" ? [each.key] : []
+    content {
+      ''' + etcd_disk_config + '''
+    }
+  }'''
+
+    # Size, pin and NUMA-place every VM on the host CPU's before anything is written or applied
+    placement = plan_cpu_placement()
+
+    # Multiqueue interfaces need the vhost-net backend on the host
+    if "multiqueue" in [ROLE_NET_PROFILES[role] for role in NODE_ROLES.values()] and not os.path.exists("/dev/vhost-net"):
+        print("/dev/vhost-net not found - load the vhost_net module on the host (modprobe vhost_net) for --net-profile multiqueue... exiting")
+        exit(1)
+
+    if ARGS.density:
+        enable_host_ksm()
+
     # Create terraform main.tf, write the config and and close the stream
-    print("Creating Terraform main.tf")
+    print("Creating Terraform main.tf (" + ARGS.clone_mode + " clones)")
     terraform_file = open(HOME_DIR + "main.tf", "w")
-    terraform_file.write('''terraform {
-  required_providers {
-    libvirt = {
-      source = "dmacvicar/libvirt"
-      version = "0.8.3"
-    }
-  }
-}
-provider "libvirt" {
+    terraform_file.write(terraform_required_providers() + '''provider "libvirt" {
   uri = "qemu:///system"
 }
 locals {
-  host_list = toset([ "master-001", "worker-001", "worker-002"])
+  host_list = toset([ ''' + ", ".join('"' + host + '"' for host in NODE_IPS) + '''])
+  host_ips = { ''' + ", ".join('"' + host + '" = "' + ip + '"' for host, ip in NODE_IPS.items()) + ''' }
+  host_vcpu = { ''' + ", ".join('"' + host + '" = ' + str(ROLE_SIZES[role][0]) for host, role in NODE_ROLES.items()) + ''' }
+  host_memory = { ''' + ", ".join('"' + host + '" = ' + str(ROLE_SIZES[role][1]) for host, role in NODE_ROLES.items()) + ''' }
+  data_disks = { ''' + ", ".join('"' + host + '" = ' + str(ROLE_DATA_DISKS[role][0] * 1024 ** 3) for host, role in NODE_ROLES.items() if role in ROLE_DATA_DISKS) + ''' }
+  domain_xslt = {
+''' + "".join('    "' + host + '" = <<-EOT\n' + domain_xslt([cpu_tuning(host, placement), disk_tuning(host), net_tuning(host), density_tuning()]) + '    EOT\n' for host in NODE_IPS) + '''  }
 }
-resource "libvirt_volume" "ol9-kvm-baseline" {
+''' + volume_config + etcd_volume_config + '''
+resource "libvirt_cloudinit_disk" "ol9-kvm-seed" {
   for_each = local.host_list
-  name = "${each.key}.qcow2"
+  name = "${each.key}-seed.iso"
   pool = "disk"
-  source = "/mnt/usb_drive/kvm/disk/ol9-kvm-baseline.qcow2"
-  format = "qcow2"
+  meta_data = <<-EOT
+    instance-id: ${each.key}
+    local-hostname: ${each.key}
+  EOT
+  user_data = <<-EOT
+''' + cloudinit_user_data() + '''  EOT
+  network_config = <<-EOT
+''' + cloudinit_network_config("${local.host_ips[each.key]}") + '''  EOT
 }
 resource "libvirt_domain" "ol9-kvm-baseline" {
   for_each = local.host_list
   name = each.key
-  memory = "8096"
-  vcpu = 4
+  memory = local.host_memory[each.key]
+  vcpu = local.host_vcpu[each.key]
+  cloudinit = libvirt_cloudinit_disk.ol9-kvm-seed[each.key].id
   cpu {
     mode = "host-passthrough"
   }
+  xml {
+    xslt = local.domain_xslt[each.key]
+  }
   disk {
     volume_id = libvirt_volume.ol9-kvm-baseline[each.key].id
   }
+  dynamic "disk" {
+    for_each = contains(keys(local.data_disks), each.key) ? [each.key] : []
+    content {
+      volume_id = libvirt_volume.ol9-kvm-data[disk.value].id
+    }
+  }''' + etcd_disk_config + '''
   console {
     type = "pty"
     target_type = "serial"
@@ -597,28 +1395,1061 @@ resource "libvirt_domain" "ol9-kvm-baseline" {
 }''')
     terraform_file.close()
     print("Completed writing Terraform main.tf\n-----------------------------------------------------------------")
+
+    # Nothing to plan when main.tf is the one last applied and every VM is still running
+    if artifact_unchanged("main.tf") and phase_is_live("Terraform", list(NODE_IPS)):
+        print("main.tf unchanged since its last apply and every VM is running - skipping terraform\n-----------------------------------------------------------------")
+        return
+
     print("Executing: terraform (init, plan, apply)")
 
-    # Execute terraform "init" and "plan"
-    subprocess.run(["terraform", "init"])
-    subprocess.run(["terraform", "plan"])
+    # Execute terraform "init" and "plan" - the plan is saved and exactly that plan is applied
+    env = terraform_env()
+    if run_command(["terraform", "init", "-input=false"], env=env).returncode != 0:
+        print("Terraform init failed... exiting")
+        exit(1)
+    plan = run_command(["terraform", "plan", "-input=false", "-detailed-exitcode", "-out=" + TERRAFORM_PLAN], env=env)
+    if plan.returncode == 1:
+        print("Terraform plan failed... exiting")
+        exit(1)
+    if plan.returncode == 0:
+        # Nothing was applied - the recorded hashes stay those of the last apply (and keep the playbooks after it)
+        print("No changes - the VM's match main.tf\n-----------------------------------------------------------------")
+        return
 
     # Obtain input from operator if they want to proceed with "apply"
-    name = input("Type YES or NO to apply the configuration: ")
+    if ARGS.auto_approve:
+        name = "YES"
+    else:
+        name = input("Type YES or NO to apply the configuration: ")
     if name == "NO": 
         print("\nNo was typed... Exiting\n")
         exit()
     if name == "YES":
-        print("Executing... (will update once completed)")
-        subprocess.run(['terraform', 'apply', '-auto-approve'])
+        print("Executing...")
+        if run_terraform_apply("cluster", ["-input=false", "-parallelism=" + str(terraform_parallelism()), TERRAFORM_PLAN], env) != 0:
+            print("Terraform apply failed... exiting")
+            exit(1)
+        record_artifact("main.tf")
         print("Complete. VM's have been deployed\n")
     else:
         print("Incorrect value typed. Exiting...")
         exit()
     return
 
+def terraform_required_providers():
+    return '''terraform {
+  required_providers {
+    libvirt = {
+      source = "''' + LIBVIRT_PROVIDER + '''"
+      version = "''' + LIBVIRT_PROVIDER_VERSION + '''"
+    }
+  }
+}
+'''
+
+def terraform_parallelism():
+    # Every volume and domain at once instead of terraform's default of 10, unless --tf-parallelism is set
+    return ARGS.tf_parallelism if ARGS.tf_parallelism > 0 else max(10, len(NODE_IPS))
+
+def run_terraform_apply(name, apply_args, env, cwd=None):
+    # Runs "terraform apply -json" and prints the progress of every resource from the streamed events
+    # Resource times are recorded in TERRAFORM_RESOURCE_TIMES and the events logged to LOG_DIR
+    # Returns the terraform return code
+    os.makedirs(LOG_DIR, exist_ok=True)
+    events_log = open(LOG_DIR + "terraform-" + name + "-events.jsonl", "w")
+    start = time.monotonic()
+    returncode = None
+    try:
+        process = subprocess.Popen(["terraform", "apply", "-json"] + apply_args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   text=True, bufsize=1, env=env, cwd=cwd)
+        for line in process.stdout:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                print(line, end="")
+                continue
+            events_log.write(line)
+            events_log.flush()
+            print_terraform_event(event)
+        returncode = process.wait()
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return 1
+    finally:
+        events_log.close()
+        record_command("terraform apply", time.monotonic() - start, returncode)
+
+    print(f"terraform apply finished in {time.monotonic() - start:.1f}s")
+    print("Slowest terraform resources (seconds)")
+    for address, seconds in sorted(TERRAFORM_RESOURCE_TIMES.items(), key=lambda item: item[1], reverse=True)[:5]:
+        print(f"  {seconds:>8}  {address}")
+    print("-----------------------------------------------------------------")
+    return returncode
+
+def print_terraform_event(event):
+    hook = event.get("hook", {})
+    address = hook.get("resource", {}).get("addr")
+    if event["type"] == "apply_start":
+        print(f"  {address}: {hook['action']} started")
+    elif event["type"] == "apply_progress":
+        print(f"  {address}: still running ({hook['elapsed_seconds']}s)")
+    elif event["type"] == "apply_complete":
+        TERRAFORM_RESOURCE_TIMES[address] = hook["elapsed_seconds"]
+        print(f"  {address}: {hook['action']} complete in {hook['elapsed_seconds']}s")
+    elif event["type"] == "apply_errored":
+        print(f"  {address}: {hook['action']} FAILED after {hook['elapsed_seconds']}s")
+    elif event["type"] == "change_summary":
+        print("  " + event["@message"])
+    elif event["type"] == "diagnostic" and event.get("@level") == "error":
+        print("  Error: " + event["diagnostic"]["summary"] + " - " + event["diagnostic"].get("detail", ""))
+
+def terraform_env():
+    # Environment for every terraform command - a CLI config with the shared plugin cache, and the provider
+    # mirror when this host has one so "terraform init" works offline
+    os.makedirs(TERRAFORM_PLUGIN_CACHE, exist_ok=True)
+    cli_config = 'plugin_cache_dir = "' + TERRAFORM_PLUGIN_CACHE + '"\n'
+    if os.path.isdir(TERRAFORM_PROVIDER_MIRROR + "registry.terraform.io/" + LIBVIRT_PROVIDER):
+        cli_config += '''provider_installation {
+  filesystem_mirror {
+    path = "''' + TERRAFORM_PROVIDER_MIRROR + '''"
+    include = ["registry.terraform.io/''' + LIBVIRT_PROVIDER + '''"]
+  }
+  direct {
+    exclude = ["registry.terraform.io/''' + LIBVIRT_PROVIDER + '''"]
+  }
+}
+'''
+    config_file = open(TERRAFORM_CLI_CONFIG, "w")
+    config_file.write(cli_config)
+    config_file.close()
+    return dict(os.environ, TF_CLI_CONFIG_FILE=TERRAFORM_CLI_CONFIG)
+
+def domain_xslt(tunings):
+    # XSLT applied by the libvirt provider to the domain XML it generates - copies the domain unchanged and
+    # applies every tuning as (elements appended to <domain>, elements appended to <devices>, templates that
+    # rewrite the elements the provider generates)
+    elements, devices, templates = ["".join(parts) for parts in zip(*tunings)]
+    return '''<?xml version="1.0"?>
+<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+  <xsl:output omit-xml-declaration="yes" indent="yes"/>
+  <xsl:template match="node()|@*">
+    <xsl:copy>
+      <xsl:apply-templates select="node()|@*"/>
+    </xsl:copy>
+  </xsl:template>
+  <xsl:template match="/domain">
+    <xsl:copy>
+      <xsl:apply-templates select="node()|@*"/>
+''' + elements + '''    </xsl:copy>
+  </xsl:template>
+  <xsl:template match="/domain/devices">
+    <xsl:copy>
+      <xsl:apply-templates select="node()|@*"/>
+''' + devices + '''    </xsl:copy>
+  </xsl:template>
+''' + templates + '''</xsl:stylesheet>
+'''
+
 #----------------------- END TERRAFORM -----------------------
 
+#-------------------- START CPU PLACEMENT --------------------
+
+def parse_cpulist(cpulist):
+    # "0-3,8,10-11" -> [0, 1, 2, 3, 8, 10, 11]
+    cpus = []
+    for part in cpulist.strip().split(","):
+        if part:
+            first, _, last = part.partition("-")
+            cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+def format_cpulist(cpus):
+    # [0, 1, 2, 3, 8] -> "0-3,8"
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(first) if first == last else str(first) + "-" + str(last) for first, last in ranges)
+
+def read_host_numa():
+    # Returns {NUMA node: {"cpus": [host CPU's], "free_hugepages": free 2M pages}} - one node when the host has no NUMA
+    numa = {}
+    for node_dir in sorted(pathlib.Path(HOST_NUMA_DIR).glob("node[0-9]*")):
+        hugepages = node_dir / "hugepages/hugepages-2048kB/free_hugepages"
+        numa[int(node_dir.name[4:])] = {
+            "cpus": parse_cpulist((node_dir / "cpulist").read_text()),
+            "free_hugepages": int(hugepages.read_text()) if hugepages.exists() else 0,
+        }
+    if not numa:
+        hugepages = pathlib.Path(HOST_HUGEPAGES_DIR + "free_hugepages")
+        numa[0] = {"cpus": list(range(os.cpu_count())), "free_hugepages": int(hugepages.read_text()) if hugepages.exists() else 0}
+    return numa
+
+def domain_running(host):
+    return run_command(["virsh", "domstate", host], capture_output=True, text=True).stdout.strip() == "running"
+
+def plan_cpu_placement():
+    # Places every pinned VM on one NUMA node - its vCPU's on dedicated host CPU's, its emulator threads on the CPU's
+    # reserved for the host, its memory (and hugepages) on the same node. Shared VM's float over the CPU's left unpinned
+    # Returns {host: {"node", "cpus", "emulator"}} for pinned VM's and {host: {"cpuset"}} for shared ones
+    # Exits before main.tf is written when the host cannot fit a VM
+    numa = read_host_numa()
+    free_cpus = {node: info["cpus"][HOST_RESERVED_CPUS:] for node, info in numa.items()}
+    free_hugepages = {node: info["free_hugepages"] for node, info in numa.items()}
+    pinned = [host for host, role in NODE_ROLES.items() if ROLE_CPU_PROFILES[role] != "shared"]
+    placement = {}
+
+    # Biggest VM's first so they are not left without a node with enough CPU's
+    for host in sorted(pinned, key=lambda host: ROLE_SIZES[NODE_ROLES[host]][0], reverse=True):
+        role = NODE_ROLES[host]
+        vcpus, memory = ROLE_SIZES[role]
+        hugepages = 0
+        if ROLE_CPU_PROFILES[role] == "pinned-hugepages":
+            if memory % 2:
+                print("--node-size " + role + " memory must be a multiple of 2 MiB for pinned-hugepages... exiting")
+                exit(1)
+            # A running VM already holds its hugepages - they are not in the free count of the host
+            hugepages = 0 if domain_running(host) else memory // 2
+        nodes = [node for node in numa if len(free_cpus[node]) >= vcpus and free_hugepages[node] >= hugepages]
+        if not nodes:
+            print("Host NUMA topology (node: free CPU's for pinning / free 2M hugepages)")
+            for node in numa:
+                print(f"  node {node}: {format_cpulist(free_cpus[node]) or '-'} / {free_hugepages[node]}")
+            print(f"{host} ({role}, {ROLE_CPU_PROFILES[role]}) needs {vcpus} CPU's and {hugepages} hugepages on one NUMA node... exiting")
+            exit(1)
+        node = max(nodes, key=lambda node: len(free_cpus[node]))
+        placement[host] = {"node": node, "cpus": free_cpus[node][:vcpus],
+                           "emulator": numa[node]["cpus"][:HOST_RESERVED_CPUS] or free_cpus[node][:vcpus]}
+        free_cpus[node] = free_cpus[node][vcpus:]
+        free_hugepages[node] -= hugepages
+
+    # Shared VM's are kept off the pinned CPU's (unrestricted when nothing is pinned)
+    pinned_cpus = [cpu for host in placement for cpu in placement[host]["cpus"]]
+    shared_cpus = [cpu for info in numa.values() for cpu in info["cpus"] if cpu not in pinned_cpus]
+    if pinned and len(pinned) < len(NODE_ROLES) and not shared_cpus:
+        print("Every host CPU is pinned - no CPU's left for the shared VM's... exiting")
+        exit(1)
+    for host in NODE_ROLES:
+        if host not in placement:
+            placement[host] = {"cpuset": shared_cpus if pinned else None}
+
+    print("VM CPU placement")
+    for host, role in NODE_ROLES.items():
+        vcpus, memory = ROLE_SIZES[role]
+        if "node" in placement[host]:
+            where = "NUMA node " + str(placement[host]["node"]) + ", vCPU's on " + format_cpulist(placement[host]["cpus"]) + \
+                    ", emulator on " + format_cpulist(placement[host]["emulator"])
+        else:
+            where = "host CPU's " + (format_cpulist(placement[host]["cpuset"]) if placement[host]["cpuset"] else "(all)")
+        print(f"  {host:<12}{role:<15}{ROLE_CPU_PROFILES[role]:<18}{vcpus:>3} vCPU {memory:>6} MiB  {where}")
+    print("-----------------------------------------------------------------")
+    return placement
+
+def cpu_tuning(host, placement):
+    # Domain XSLT tuning for the CPU profile of a host
+    vcpus, memory = ROLE_SIZES[NODE_ROLES[host]]
+    if "node" not in placement[host]:
+        if not placement[host]["cpuset"]:
+            return "", "", ""
+        return "", "", '''  <xsl:template match="/domain/vcpu">
+    <vcpu placement="static" cpuset="''' + format_cpulist(placement[host]["cpuset"]) + '''"><xsl:value-of select="."/></vcpu>
+  </xsl:template>
+'''
+    node = str(placement[host]["node"])
+    elements = '''      <cputune>
+''' + "".join('''        <vcpupin vcpu="''' + str(vcpu) + '''" cpuset="''' + str(cpu) + '''"/>
+''' for vcpu, cpu in enumerate(placement[host]["cpus"])) + '''        <emulatorpin cpuset="''' + format_cpulist(placement[host]["emulator"]) + '''"/>
+      </cputune>
+      <numatune>
+        <memory mode="strict" nodeset="''' + node + '''"/>
+      </numatune>
+'''
+    if ROLE_CPU_PROFILES[NODE_ROLES[host]] == "pinned-hugepages":
+        elements += '''      <memoryBacking>
+        <hugepages>
+          <page size="2048" unit="KiB"/>
+        </hugepages>
+      </memoryBacking>
+'''
+    # The guest sees its vCPU's as the cores of one socket, matching the single NUMA node they are pinned to
+    templates = '''  <xsl:template match="/domain/cpu">
+    <xsl:copy>
+      <xsl:apply-templates select="node()|@*"/>
+      <topology sockets="1" dies="1" cores="''' + str(vcpus) + '''" threads="1"/>
+    </xsl:copy>
+  </xsl:template>
+'''
+    return elements, "", templates
+
+#--------------------- END CPU PLACEMENT ---------------------
+
+#----------------------- START DISK I/O ----------------------
+
+def disk_tuning(host):
+    # Domain XSLT tuning for the disk profile of a host - rewrites the driver and target of every disk
+    vcpus = ROLE_SIZES[NODE_ROLES[host]][0]
+    profile = DISK_PROFILES[ROLE_DISK_PROFILES[NODE_ROLES[host]]]
+    if not profile:
+        return "", "", ""
+    driver = 'name="qemu" type="{driver/@type}" cache="' + profile["cache"] + '" io="' + profile["io"] + '" discard="' + profile["discard"] + '"'
+    if profile["bus"] == "virtio":
+        # virtio-blk - one iothread and one queue per vCPU for every disk
+        elements = '''      <iothreads><xsl:value-of select="count(devices/disk[@device='disk'])"/></iothreads>
+'''
+        devices = ""
+        driver += ' queues="' + str(vcpus) + '" iothread="{count(preceding-sibling::disk[@device=\'disk\']) + 1}"'
+        target = '<target dev="{target/@dev}" bus="virtio"/>'
+    else:
+        # virtio-scsi - every disk on one controller with its own iothread, vda becomes sda
+        elements = '''      <iothreads>1</iothreads>
+'''
+        devices = '''      <controller type="scsi" index="0" model="virtio-scsi">
+        <driver iothread="1" queues="''' + str(vcpus) + '''"/>
+      </controller>
+'''
+        target = '<target dev="sd{substring(target/@dev, 3)}" bus="scsi"/>'
+    templates = '''  <xsl:template match="/domain/devices/disk[@device='disk']">
+    <xsl:copy>
+      <xsl:apply-templates select="@*|node()[not(self::driver or self::target or self::address)]"/>
+      <driver ''' + driver + '''/>
+      ''' + target + '''
+    </xsl:copy>
+  </xsl:template>
+'''
+    return elements, devices, templates
+
+def node_disks(host):
+    # Device and mount point of the disks attached after the root disk, in order - the data disk, then the etcd disk
+    mounts = []
+    if NODE_ROLES[host] in ROLE_DATA_DISKS:
+        mounts.append(ROLE_DATA_DISKS[NODE_ROLES[host]][1])
+    if ETCD_DISK and host == "master-001":
+        mounts.append(ETCD_DATA_DIR)
+    profile = DISK_PROFILES[ROLE_DISK_PROFILES[NODE_ROLES[host]]]
+    prefix = "/dev/sd" if profile and profile["bus"] == "scsi" else "/dev/vd"
+    return [{"device": prefix + "bcdefgh"[index], "mount": mount} for index, mount in enumerate(mounts)]
+
+def run_fio(ip, job, directory):
+    # Runs one fio job in the guest - returns {"mib_per_second", "iops", "p99_ms"}
+    test_file = directory.rstrip("/") + "/k8-fio.test"
+    command = "mkdir -p " + directory + " && " + " ".join(["fio", "--name=" + job, "--filename=" + test_file, "--runtime=" + str(FIO_RUNTIME), "--time_based",
+                        "--output-format=json"] + FIO_JOBS[job]) + "; rm -f " + test_file
+    result = ssh_command(ip, command)
+    try:
+        stats = json.loads(result.stdout)["jobs"][0]
+    except (ValueError, KeyError, IndexError):
+        print("fio " + job + " failed on " + ip + ": " + result.stderr.strip() + "... exiting")
+        exit(1)
+    return fio_result(job, stats)
+
+def fio_result(job, stats):
+    # {"mib_per_second", "iops", "p99_ms"} of one job of the fio JSON output
+    side = stats["read"] if stats["read"]["io_bytes"] else stats["write"]
+    # fdatasync jobs are measured by the latency of the sync, the others by the completion latency
+    latency = stats["sync"]["lat_ns"] if "--fdatasync=1" in FIO_JOBS[job] else side["clat_ns"]
+    return {"mib_per_second": round(side["bw"] / 1024, 1), "iops": round(side["iops"]),
+            "p99_ms": round(latency.get("percentile", {}).get("99.000000", 0) / 1000000, 2)}
+
+def Disk_Benchmark():
+    # Runs the fio jobs inside every node of the running cluster on its root disk and its data disk - one node and one
+    # job at a time so they don't compete for the pool - and writes the results with the disk profiles to LOG_DIR
+    results = {}
+    for host, ip in NODE_IPS.items():
+        if not port_open(ip, READY_PORTS["ssh"]):
+            print(host + " (" + ip + ") is not answering on SSH - build the cluster with the same --workers and --ip-range first... exiting")
+            exit(1)
+        disks = {"root": "/var/tmp"}
+        if NODE_ROLES[host] in ROLE_DATA_DISKS:
+            disks["data"] = ROLE_DATA_DISKS[NODE_ROLES[host]][1]
+        for disk, directory in disks.items():
+            for job in FIO_JOBS:
+                print(f"  {host}: {job} on the {disk} disk ({directory}), {FIO_RUNTIME}s...")
+                results.setdefault(host, {}).setdefault(disk, {})[job] = run_fio(ip, job, directory)
+    print("-----------------------------------------------------------------")
+
+    print(f"  {'node':<12}{'profile':<13}{'disk':<6}{'job':<15}{'MiB/s':>9}{'IOPS':>9}{'p99 ms':>9}")
+    for host, disks in results.items():
+        for disk, jobs in disks.items():
+            for job, result in jobs.items():
+                print(f"  {host:<12}{ROLE_DISK_PROFILES[NODE_ROLES[host]]:<13}{disk:<6}{job:<15}"
+                      f"{result['mib_per_second']:>9}{result['iops']:>9}{result['p99_ms']:>9}")
+
+    date = time.strftime("%Y-%m-%dT%H:%M:%S")
+    report = {
+        "date": date,
+        "disk_profiles": {host: ROLE_DISK_PROFILES[role] for host, role in NODE_ROLES.items()},
+        "data_disks": {host: ROLE_DATA_DISKS[role][1] for host, role in NODE_ROLES.items() if role in ROLE_DATA_DISKS},
+        "fio_runtime": FIO_RUNTIME,
+        "results": results,
+    }
+    report_path = write_report("disk-benchmark", report)
+    print("Disk benchmark report written to " + report_path)
+    print("-----------------------------------------------------------------")
+
+#------------------------ END DISK I/O -----------------------
+
+#----------------------- START NETWORK -----------------------
+
+def net_tuning(host):
+    # Domain XSLT tuning for the network profile of a host - a queue pair per vCPU on the vhost-net backend
+    if ROLE_NET_PROFILES[NODE_ROLES[host]] != "multiqueue":
+        return "", "", ""
+    return "", "", '''  <xsl:template match="/domain/devices/interface">
+    <xsl:copy>
+      <xsl:apply-templates select="@*|node()[not(self::model or self::driver)]"/>
+      <model type="virtio"/>
+      <driver name="vhost" queues="''' + str(ROLE_SIZES[NODE_ROLES[host]][0]) + '''" rx_queue_size="''' + str(NET_RX_QUEUE_SIZE) + '''"/>
+    </xsl:copy>
+  </xsl:template>
+'''
+
+def net_queues_script():
+    # Run at every boot in multiqueue nodes - enables every queue pair of the interface, steers received packets of a
+    # flow to the vCPU of the application reading it (RPS/RFS) and pins each transmit queue to its own vCPU (XPS).
+    # sysfs takes CPU masks as comma separated 32-bit words, so nodes with more than 32 vCPU's get a mask per word
+    return '''        #!/bin/bash
+        dev=$(ip -o route show default | awk '{print $5; exit}')
+        cpus=$(nproc)
+        cpumask() {
+          # Mask of the CPU's $1 to $2, highest word first
+          local mask="" word bit bits
+          for (( word = (cpus - 1) / 32; word >= 0; word-- )); do
+            bits=0
+            for (( bit = 0; bit < 32; bit++ )); do
+              (( word * 32 + bit >= $1 && word * 32 + bit <= $2 )) && bits=$(( bits | (1 << bit) ))
+            done
+            mask+=$(printf '%08x' "$bits")
+            (( word > 0 )) && mask+=","
+          done
+          echo "$mask"
+        }
+        ethtool -L "$dev" combined "$cpus" || true
+        queues=$(ls -d /sys/class/net/$dev/queues/rx-* | wc -l)
+        sysctl -qw net.core.rps_sock_flow_entries=32768
+        for rx in /sys/class/net/$dev/queues/rx-*; do
+          cpumask 0 $(( cpus - 1 )) > "$rx/rps_cpus"
+          echo $(( 32768 / queues )) > "$rx/rps_flow_cnt"
+        done
+        cpu=0
+        for tx in /sys/class/net/$dev/queues/tx-*; do
+          cpumask $(( cpu % cpus )) $(( cpu % cpus )) > "$tx/xps_cpus"
+          cpu=$(( cpu + 1 ))
+        done
+'''
+
+def kubectl_on_master(args):
+    # Runs kubectl on the master over SSH
+    return ssh_command(MASTER_IP, KUBECTL + " " + args)
+
+def net_benchmark_manifest():
+    return '''apiVersion: v1
+kind: Namespace
+metadata:
+  name: ''' + NET_BENCHMARK_NAMESPACE + '''
+---
+apiVersion: apps/v1
+kind: DaemonSet
+metadata:
+  name: iperf3
+  namespace: ''' + NET_BENCHMARK_NAMESPACE + '''
+spec:
+  selector:
+    matchLabels:
+      app: iperf3
+  template:
+    metadata:
+      labels:
+        app: iperf3
+    spec:
+      tolerations:
+        - operator: Exists
+      containers:
+        - name: iperf3
+          image: ''' + IPERF3_IMAGE + '''
+          args: ["-s"]
+          ports:
+            - containerPort: 5201
+'''
+
+def Net_Benchmark():
+    # Runs an iperf3 server pod on every node and sends from each node's pod to the pod of the next node over the
+    # pod network, one pair at a time - the namespace is deleted at the end and the results written to LOG_DIR
+    if not port_open(MASTER_IP, READY_PORTS["ssh"]) or not apiserver_ready(MASTER_IP):
+        print("The API server on " + MASTER_IP + " is not ready - build the cluster with the same --workers and --ip-range first... exiting")
+        exit(1)
+    results = {}
+    try:
+        print("Starting an iperf3 server pod on every node...")
+        if kubectl_on_master("apply -f - <<'EOF'\n" + net_benchmark_manifest() + "EOF").returncode != 0 or kubectl_on_master(
+                "-n " + NET_BENCHMARK_NAMESPACE + " rollout status daemonset/iperf3 --timeout=" + str(READY_TIMEOUT) + "s").returncode != 0:
+            print("The iperf3 pods did not start... exiting")
+            exit(1)
+        pods = {}
+        for pod in json.loads(kubectl_on_master("-n " + NET_BENCHMARK_NAMESPACE + " get pods -l app=iperf3 -o json").stdout)["items"]:
+            pods[pod["spec"]["nodeName"]] = (pod["metadata"]["name"], pod["status"]["podIP"])
+        nodes = [host for host in NODE_IPS if host in pods]
+        if len(nodes) < 2:
+            print("iperf3 pods are running on fewer than 2 nodes... exiting")
+            exit(1)
+
+        for index, client in enumerate(nodes):
+            server = nodes[(index + 1) % len(nodes)]
+            print(f"  {client} -> {server}: {IPERF3_STREAMS} streams, {IPERF3_SECONDS}s...")
+            result = kubectl_on_master("-n " + NET_BENCHMARK_NAMESPACE + " exec " + pods[client][0] + " -- iperf3 -J -c " + pods[server][1] +
+                                       " -t " + str(IPERF3_SECONDS) + " -P " + str(IPERF3_STREAMS))
+            try:
+                end = json.loads(result.stdout)["end"]
+            except (ValueError, KeyError):
+                print("iperf3 from " + client + " to " + server + " failed: " + result.stderr.strip() + "... exiting")
+                exit(1)
+            results[client + " -> " + server] = {"gbit_per_second": round(end["sum_received"]["bits_per_second"] / 1e9, 2),
+                                                  "retransmits": end["sum_sent"].get("retransmits", 0)}
+    finally:
+        print("Deleting the " + NET_BENCHMARK_NAMESPACE + " namespace...")
+        kubectl_on_master("delete namespace " + NET_BENCHMARK_NAMESPACE + " --ignore-not-found")
+    print("-----------------------------------------------------------------")
+
+    print(f"  {'pods':<28}{'Gbit/s':>9}{'retransmits':>13}")
+    for pair, result in results.items():
+        print(f"  {pair:<28}{result['gbit_per_second']:>9}{result['retransmits']:>13}")
+
+    date = time.strftime("%Y-%m-%dT%H:%M:%S")
+    report = {
+        "date": date,
+        "net_profiles": {host: ROLE_NET_PROFILES[role] for host, role in NODE_ROLES.items()},
+        "cpu_profiles": {host: ROLE_CPU_PROFILES[role] for host, role in NODE_ROLES.items()},
+        "iperf3_seconds": IPERF3_SECONDS,
+        "iperf3_streams": IPERF3_STREAMS,
+        "results": results,
+    }
+    report_path = write_report("net-benchmark", report)
+    print("Network benchmark report written to " + report_path)
+    print("-----------------------------------------------------------------")
+
+#------------------------ END NETWORK ------------------------
+
+#----------------------- START DENSITY -----------------------
+
+def density_tuning():
+    # Domain XSLT tuning for --density - replaces the default balloon with one that hands the pages the guest
+    # frees back to the host (free page reporting), deflates itself under guest memory pressure and reports statistics
+    if not ARGS.density:
+        return "", "", ""
+    return "", '''      <memballoon model="virtio" autodeflate="on" freePageReporting="on">
+        <stats period="''' + str(BALLOON_STATS_PERIOD) + '''"/>
+      </memballoon>
+''', '''  <xsl:template match="/domain/devices/memballoon"/>
+'''
+
+def enable_host_ksm():
+    # KSM merges the identical pages of the VM's cloned from one image (QEMU marks guest memory mergeable)
+    print("Enabling KSM on the host (" + HOST_KSM_DIR + ")")
+    try:
+        for setting, value in KSM_SETTINGS.items():
+            pathlib.Path(HOST_KSM_DIR + setting).write_text(value + "\n")
+    except OSError as e:
+        print(f"KSM could not be enabled: {e} - run as root or: echo 1 | sudo tee {HOST_KSM_DIR}run... exiting")
+        exit(1)
+    print("-----------------------------------------------------------------")
+
+def read_ksm():
+    # Returns every counter in HOST_KSM_DIR, {} when the host has no KSM
+    counters = {}
+    for counter in pathlib.Path(HOST_KSM_DIR).glob("*"):
+        try:
+            counters[counter.name] = int(counter.read_text())
+        except (OSError, ValueError):
+            pass
+    return counters
+
+def ksmd_cpu_seconds():
+    # CPU time of the KSM scanner thread - the cost of the deduplication
+    for comm in pathlib.Path("/proc").glob("[0-9]*/comm"):
+        try:
+            if comm.read_text().strip() == "ksmd":
+                stat = (comm.parent / "stat").read_text().rsplit(")", 1)[1].split()
+                return round((int(stat[11]) + int(stat[12])) / os.sysconf("SC_CLK_TCK"), 1)
+        except OSError:
+            pass
+    return None
+
+def domain_memory(host):
+    # virsh dommemstat in MiB - actual (balloon size), rss (resident on the host), unused / available (guest view)
+    result = run_command(["virsh", "dommemstat", host], capture_output=True, text=True)
+    stats = {}
+    for line in result.stdout.splitlines():
+        name, _, value = line.partition(" ")
+        if value.strip().isdigit():
+            stats[name] = round(int(value) / 1024)
+    return stats
+
+def Memory_Report():
+    # Resident memory of every VM against its configured memory, and what KSM saves on the host
+    page_mib = os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    ksm = read_ksm()
+    domains = {}
+    for host, role in NODE_ROLES.items():
+        stats = domain_memory(host)
+        if "rss" not in stats:
+            print(host + " is not running - skipped")
+            continue
+        domains[host] = dict(stats, configured=ROLE_SIZES[role][1])
+
+    print(f"  {'node':<12}{'configured':>11}{'balloon':>9}{'resident':>10}{'guest unused':>14}   (MiB)")
+    for host, stats in domains.items():
+        print(f"  {host:<12}{stats['configured']:>11}{stats.get('actual', '-'):>9}{stats['rss']:>10}{stats.get('unused', '-'):>14}")
+    configured = sum(stats["configured"] for stats in domains.values())
+    resident = sum(stats["rss"] for stats in domains.values())
+    # pages_sharing counts the guest pages that point at a shared page instead of their own copy
+    saved = round(ksm.get("pages_sharing", 0) * page_mib)
+    print(f"  {'Total':<12}{configured:>11}{'':>9}{resident:>10}")
+    if ksm:
+        print(f"KSM: {'running' if ksm.get('run') == 1 else 'stopped'}, {saved} MiB saved ({ksm.get('pages_shared', 0)} shared pages, "
+              f"{ksm.get('pages_sharing', 0)} sharing, {ksm.get('full_scans', 0)} full scans), ksmd CPU {ksmd_cpu_seconds()}s")
+    else:
+        print("KSM: not available on this host")
+    if resident:
+        print(f"Density: {configured / resident:.2f}x - configured memory per MiB resident on the host")
+
+    date = time.strftime("%Y-%m-%dT%H:%M:%S")
+    report = {
+        "date": date,
+        "density": ARGS.density,
+        "domains": domains,
+        "configured_mib": configured,
+        "resident_mib": resident,
+        "ksm": ksm,
+        "ksm_saved_mib": saved,
+        "ksmd_cpu_seconds": ksmd_cpu_seconds(),
+    }
+    report_path = write_report("memory-report", report)
+    print("Memory report written to " + report_path)
+    print("-----------------------------------------------------------------")
+
+#------------------------ END DENSITY ------------------------
+
+#------------------- START STORAGE BENCHMARK -----------------
+
+def storage_benchmark_manifest(name, storage_class, host):
+    # A claim of the class and a Job on the host that runs every fio job on it, one after the other (stonewall). Every
+    # job removes its file when it ends (unlink) - the claim only has to hold the largest one
+    args = ["--directory=/data", "--runtime=" + str(FIO_RUNTIME), "--time_based", "--output-format=json"]
+    for job, options in FIO_JOBS.items():
+        args += ["--name=" + job, "--stonewall", "--unlink=1"] + options
+    return '''apiVersion: v1
+kind: PersistentVolumeClaim
+metadata:
+  name: ''' + name + '''
+  namespace: ''' + STORAGE_BENCHMARK_NAMESPACE + '''
+spec:
+  storageClassName: ''' + storage_class + '''
+  accessModes:
+    - ReadWriteOnce
+  resources:
+    requests:
+      storage: ''' + STORAGE_BENCHMARK_CLAIM + '''
+---
+apiVersion: batch/v1
+kind: Job
+metadata:
+  name: ''' + name + '''
+  namespace: ''' + STORAGE_BENCHMARK_NAMESPACE + '''
+spec:
+  backoffLimit: 0
+  template:
+    spec:
+      restartPolicy: Never
+      nodeSelector:
+        kubernetes.io/hostname: ''' + host + '''
+      tolerations:
+        - operator: Exists
+      containers:
+        - name: fio
+          image: ''' + FIO_IMAGE + '''
+          command: ["fio"]
+          args: ''' + json.dumps(args) + '''
+          volumeMounts:
+            - name: data
+              mountPath: /data
+      volumes:
+        - name: data
+          persistentVolumeClaim:
+            claimName: ''' + name + '''
+'''
+
+def storage_classes():
+    # {name: {"provisioner", "parameters", "mount_options", "binding_mode"}} of the StorageClasses of the cluster
+    result = kubectl_on_master("get storageclass -o json")
+    classes = {}
+    for storage_class in json.loads(result.stdout or "{}").get("items", []):
+        classes[storage_class["metadata"]["name"]] = {"provisioner": storage_class["provisioner"],
+                                                      "parameters": storage_class.get("parameters", {}),
+                                                      "mount_options": storage_class.get("mountOptions", []),
+                                                      "binding_mode": storage_class.get("volumeBindingMode", "Immediate")}
+    return classes
+
+def run_storage_fio(storage_class, host):
+    # Runs the Job of one class on one host and deletes it with its claim - returns {job: result} or {"error"}
+    name = "fio-" + storage_class + "-" + host
+    # The claim is provisioned and fio lays out its files before the jobs start, allow for both
+    timeout = READY_TIMEOUT + 2 * FIO_RUNTIME * len(FIO_JOBS)
+    try:
+        if kubectl_on_master("apply -f - <<'EOF'\n" + storage_benchmark_manifest(name, storage_class, host) + "EOF").returncode != 0:
+            return {"error": "the claim or the Job could not be created"}
+        if kubectl_on_master("-n " + STORAGE_BENCHMARK_NAMESPACE + " wait --for=condition=complete job/" + name +
+                             " --timeout=" + str(timeout) + "s").returncode != 0:
+            return {"error": "the Job did not complete in " + str(timeout) + "s"}
+        output = kubectl_on_master("-n " + STORAGE_BENCHMARK_NAMESPACE + " logs job/" + name).stdout
+        try:
+            # The JSON is preceded by any warnings fio printed
+            jobs = json.JSONDecoder().raw_decode(output[output.find("{"):])[0]["jobs"]
+        except (ValueError, KeyError):
+            return {"error": "no fio results in the pod log"}
+        return {stats["jobname"]: fio_result(stats["jobname"], stats) for stats in jobs}
+    finally:
+        kubectl_on_master("-n " + STORAGE_BENCHMARK_NAMESPACE + " delete job/" + name + " pvc/" + name + " --cascade=foreground --ignore-not-found")
+
+def Storage_Benchmark():
+    # Runs the fio jobs on a new claim of every StorageClass from a pod on every node, one pod at a time so they don't
+    # compete for the storage - the namespace and the claims are deleted at the end and the results written to LOG_DIR
+    if not port_open(MASTER_IP, READY_PORTS["ssh"]) or not apiserver_ready(MASTER_IP):
+        print("The API server on " + MASTER_IP + " is not ready - build the cluster with the same --workers and --ip-range first... exiting")
+        exit(1)
+    classes = storage_classes()
+    for name in ARGS.storage_class:
+        if name not in classes:
+            print("StorageClass " + name + " does not exist in the cluster (" + ", ".join(classes) + ")... exiting")
+            exit(1)
+    selected = [name for name in classes if name in ARGS.storage_class or not ARGS.storage_class]
+    skipped = {}
+    for name in list(selected):
+        # Claims of a class without a provisioner take the static PV's of the nodes (local-storage, Retain) and leave
+        # them Released - the data disks behind them are measured by disk-benchmark instead
+        if classes[name]["provisioner"] == "kubernetes.io/no-provisioner":
+            skipped[name] = "static PV's (no provisioner) - see disk-benchmark"
+            selected.remove(name)
+            print("StorageClass " + name + " has no provisioner - skipped (disk-benchmark measures its data disks)")
+    if not selected:
+        print("No StorageClass to benchmark... exiting")
+        exit(1)
+
+    results = {}
+    try:
+        # Starts from an empty namespace so an interrupted run leaves nothing behind that changes the next one
+        kubectl_on_master("delete namespace " + STORAGE_BENCHMARK_NAMESPACE + " --ignore-not-found")
+        if kubectl_on_master("create namespace " + STORAGE_BENCHMARK_NAMESPACE).returncode != 0:
+            print("The " + STORAGE_BENCHMARK_NAMESPACE + " namespace could not be created... exiting")
+            exit(1)
+        for storage_class in selected:
+            for host in NODE_ROLES:
+                print(f"  {storage_class} on {host}: {', '.join(FIO_JOBS)} ({FIO_RUNTIME}s each)...")
+                results.setdefault(storage_class, {})[host] = run_storage_fio(storage_class, host)
+                if "error" in results[storage_class][host]:
+                    print("  " + storage_class + " on " + host + " failed: " + results[storage_class][host]["error"])
+    finally:
+        print("Deleting the " + STORAGE_BENCHMARK_NAMESPACE + " namespace...")
+        kubectl_on_master("delete namespace " + STORAGE_BENCHMARK_NAMESPACE + " --ignore-not-found")
+    print("-----------------------------------------------------------------")
+
+    print(f"  {'class':<16}{'node':<12}{'job':<15}{'MiB/s':>9}{'IOPS':>9}{'p99 ms':>9}")
+    for storage_class, hosts in results.items():
+        for host, jobs in hosts.items():
+            if "error" in jobs:
+                print(f"  {storage_class:<16}{host:<12}failed: {jobs['error']}")
+                continue
+            for job, result in jobs.items():
+                print(f"  {storage_class:<16}{host:<12}{job:<15}{result['mib_per_second']:>9}{result['iops']:>9}{result['p99_ms']:>9}")
+
+    date = time.strftime("%Y-%m-%dT%H:%M:%S")
+    report = {
+        "date": date,
+        "storage_classes": {name: classes[name] for name in selected},
+        "skipped": skipped,
+        "nfs_mount_profile": ARGS.nfs_mount_profile,
+        "disk_profiles": {host: ROLE_DISK_PROFILES[role] for host, role in NODE_ROLES.items()},
+        "fio_image": FIO_IMAGE,
+        "fio_runtime": FIO_RUNTIME,
+        "fio_jobs": FIO_JOBS,
+        "results": results,
+    }
+    report_path = write_report("storage-benchmark", report)
+    print("Storage benchmark report written to " + report_path)
+    print("-----------------------------------------------------------------")
+
+#-------------------- END STORAGE BENCHMARK ------------------
+
+#------------------------ START MIRROR -----------------------
+
+def mirror_url(path=""):
+    return "http://" + ARGS.mirror + ":" + str(MIRROR_HTTP_PORT) + "/" + path
+
+def start_container(name, run_args):
+    # Re-uses an existing container so the mirror keeps its warm cache between runs
+    if run_command(["podman", "container", "exists", name]).returncode == 0:
+        return run_command(["podman", "start", name], capture_output=True, text=True).returncode == 0
+    return run_command(["podman", "run", "-d", "--name", name, "--restart=always"] + run_args).returncode == 0
+
+def Mirror_Setup():
+    # Syncs the repo's, packages and files the nodes install into MIRROR_DIR and serves them - re-running only
+    # downloads what changed upstream. Container images are cached by the registries as the nodes pull them
+    http_dir = MIRROR_DIR + "http/"
+    os.makedirs(http_dir + "files/csi-driver-nfs", exist_ok=True)
+    os.makedirs(http_dir + "pip", exist_ok=True)
+
+    for name, url in RPM_REPOS.items():
+        print("Syncing " + name + " repo...")
+        sync = run_command(["dnf", "reposync", "--repofrompath=" + name + "," + url, "--repoid=" + name,
+                               "--newest-only", "--download-metadata", "-p", http_dir])
+        key = run_command(["curl", "-fsSL", "-o", http_dir + name + "/repodata/repomd.xml.key", url + "repodata/repomd.xml.key"])
+        if sync.returncode != 0 or key.returncode != 0:
+            print("There was an error syncing the " + name + " repo... exiting")
+            exit(1)
+        print("-----------------------------------------------------------------")
+
+    print("Downloading base packages and their dependencies...")
+    download = run_command(["dnf", "download", "--resolve", "--alldeps", "--destdir", http_dir + "k8-base"] + BASE_PACKAGES)
+    createrepo = run_command(["createrepo_c", "--update", http_dir + "k8-base"])
+    if download.returncode != 0 or createrepo.returncode != 0:
+        print("There was an error creating the base packages repo... exiting")
+        exit(1)
+    print("-----------------------------------------------------------------")
+
+    print("Downloading pip packages...")
+    if run_command(["python3", "-m", "pip", "download", "--dest", http_dir + "pip"] + PIP_PACKAGES).returncode != 0:
+        print("There was an error downloading the pip packages... exiting")
+        exit(1)
+    print("-----------------------------------------------------------------")
+
+    print("Downloading manifests and binaries...")
+    for path, url in MIRROR_FILES.items():
+        # -z only downloads when upstream is newer than the cached copy
+        dest = http_dir + "files/" + path
+        z_args = ["-z", dest] if os.path.exists(dest) else []
+        if run_command(["curl", "-fsSL"] + z_args + ["-o", dest, url]).returncode != 0:
+            print("There was an error downloading " + url + "... exiting")
+            exit(1)
+    print("-----------------------------------------------------------------")
+
+    print("Mirroring the terraform libvirt provider...")
+    provider_dir = MIRROR_DIR + "terraform-providers/"
+    os.makedirs(provider_dir, exist_ok=True)
+    providers_file = open(provider_dir + "providers.tf", "w")
+    providers_file.write(terraform_required_providers())
+    providers_file.close()
+    if run_command(["terraform", "providers", "mirror", TERRAFORM_PROVIDER_MIRROR], cwd=provider_dir).returncode != 0:
+        print("There was an error mirroring the terraform provider... exiting")
+        exit(1)
+    print("-----------------------------------------------------------------")
+
+    print("Starting mirror containers...")
+    # pip --find-links reads the HTML directory listing of pip/ - the stock nginx config answers directories with a 403
+    nginx_file = open(MIRROR_DIR + "nginx.conf", "w")
+    nginx_file.write('''server {
+    listen 80;
+    root /usr/share/nginx/html;
+    location / {
+        autoindex on;
+    }
+}
+''')
+    nginx_file.close()
+    # The HTTP container keeps nothing but its config - recreated so an older one picks up the listing
+    run_command(["podman", "rm", "-f", "k8-mirror-http"], capture_output=True)
+    ports = [MIRROR_HTTP_PORT]
+    started = start_container("k8-mirror-http", ["-p", str(MIRROR_HTTP_PORT) + ":80", "-v", http_dir + ":/usr/share/nginx/html:ro,Z",
+                                                 "-v", MIRROR_DIR + "nginx.conf:/etc/nginx/conf.d/default.conf:ro,Z",
+                                                 "docker.io/library/nginx:stable"])
+    for registry, (remote_url, port) in MIRROR_REGISTRIES.items():
+        os.makedirs(MIRROR_DIR + "registry/" + registry, exist_ok=True)
+        ports.append(port)
+        started = start_container("k8-mirror-" + registry.replace(".", "-"),
+                                  ["-p", str(port) + ":5000", "-v", MIRROR_DIR + "registry/" + registry + ":/var/lib/registry:Z",
+                                   "-e", "REGISTRY_PROXY_REMOTEURL=" + remote_url, "docker.io/library/registry:2"]) and started
+    if not started:
+        print("There was an error starting the mirror containers... exiting")
+        exit(1)
+
+    if shutil.which("firewall-cmd"):
+        for port in ports:
+            run_command(["firewall-cmd", "--permanent", "--add-port=" + str(port) + "/tcp"], capture_output=True)
+        run_command(["firewall-cmd", "--reload"], capture_output=True)
+    print("Mirror is ready - build with: ./k8-create.py --mirror [this host's br0 IP]\n-----------------------------------------------------------------")
+
+#------------------------- END MIRROR ------------------------
+
+#------------------------- START BAKE ------------------------
+
+def golden_image_path():
+    # The golden image is versioned by the bake tasks and the baseline image it was baked from,
+    # so changing either one produces a new image instead of silently reusing a stale one
+    baseline = os.stat(BASELINE_IMAGE)
+    version = hashlib.sha256((baseline_bake_tasks() + str(baseline.st_size) + str(baseline.st_mtime_ns)).encode()).hexdigest()[:10]
+    return os.path.dirname(BASELINE_IMAGE) + "/ol9-kvm-golden-" + version + ".qcow2"
+
+def golden_image_in_use():
+    return not ARGS.no_golden and os.path.exists(BASELINE_IMAGE) and os.path.exists(golden_image_path())
+
+def other_golden_images():
+    # Golden images baked from other bake tasks (another --mirror, or none) or an older baseline image
+    images = [str(image) for image in pathlib.Path(os.path.dirname(BASELINE_IMAGE)).glob("ol9-kvm-golden-*.qcow2")]
+    return sorted(image for image in images if image != golden_image_path())
+
+def Bake():
+    # Applies the node-agnostic baseline tasks to a temporary VM cloned from the baseline image,
+    # pre-pulls the kubeadm control plane images and saves its disk as the golden image
+    try:
+        golden_image = golden_image_path()
+    except FileNotFoundError:
+        print("Basline qcow file NOT found... exiting")
+        exit(1)
+    if os.path.exists(golden_image):
+        print("Golden image is up to date: " + golden_image + "\n-----------------------------------------------------------------")
+        return
+
+    os.makedirs(BAKE_DIR, exist_ok=True)
+    ensure_ssh_key()
+    print("Creating bake VM Terraform main.tf")
+    terraform_file = open(BAKE_DIR + "main.tf", "w")
+    terraform_file.write(terraform_required_providers() + '''provider "libvirt" {
+  uri = "qemu:///system"
+}
+resource "libvirt_volume" "k8-bake-base" {
+  name = "k8-bake-base.qcow2"
+  pool = "disk"
+  source = "''' + BASELINE_IMAGE + '''"
+  format = "qcow2"
+}
+resource "libvirt_volume" "k8-bake" {
+  name = "k8-bake.qcow2"
+  pool = "disk"
+  base_volume_id = libvirt_volume.k8-bake-base.id
+  format = "qcow2"
+}
+resource "libvirt_cloudinit_disk" "k8-bake-seed" {
+  name = "k8-bake-seed.iso"
+  pool = "disk"
+  meta_data = <<-EOT
+    instance-id: k8-bake
+  EOT
+  user_data = <<-EOT
+''' + cloudinit_user_data() + '''  EOT
+}
+resource "libvirt_domain" "k8-bake" {
+  name = "k8-bake"
+  memory = "8096"
+  vcpu = 4
+  cloudinit = libvirt_cloudinit_disk.k8-bake-seed.id
+  cpu {
+    mode = "host-passthrough"
+  }
+  disk {
+    volume_id = libvirt_volume.k8-bake.id
+  }
+  console {
+    type = "pty"
+    target_type = "serial"
+    target_port = "0"
+  }
+  network_interface {
+    bridge = "br0"
+  }
+}''')
+    terraform_file.close()
+
+    print("Creating bake VM...")
+    env = terraform_env()
+    run_command(["terraform", "init", "-input=false"], cwd=BAKE_DIR, env=env)
+    if run_terraform_apply("bake", ["-auto-approve"], env, cwd=BAKE_DIR) != 0:
+        print("Bake VM could not be created... exiting")
+        exit(1)
+    print("-----------------------------------------------------------------")
+
+    print("\nWaiting for the bake VM to obtain an IP Address and start SSH...\n")
+    ip = wait_for_hosts(["k8-bake"], ["agent_ip", "ssh"], label="bake")["k8-bake"]
+
+    print("Writing Ansible BAKE playbook")
+    ansible_inv = open(BAKE_DIR + "inventory.ini", "w")
+    ansible_inv.write("k8-bake ansible_host=" + ip + "\n")
+    ansible_inv.close()
+    write_ansible_cfgs(BAKE_DIR)
+
+    bake_playbook = open(BAKE_DIR + "bake_playbook.yaml", "w")
+    bake_playbook.write('''- hosts: k8-bake
+  become: true
+  tasks:
+
+''' + baseline_bake_tasks() + '''
+#---------------------------------> PRE-PULL AND SEAL THE IMAGE
+
+  - name: Pre-pull the kubeadm control plane images
+    shell: kubeadm config images pull --kubernetes-version "$(kubeadm version -o short)"
+
+  - name: Clean the dnf cache
+    command: dnf clean all
+
+  - name: Remove network profiles so each clone re-creates its own at boot
+    shell: rm -f /etc/NetworkManager/system-connections/*
+
+  - name: Reset cloud-init so each clone applies its own seed
+    command: cloud-init clean --logs
+
+  - name: Reset machine-id so each clone generates its own
+    shell: truncate -s 0 /etc/machine-id && rm -f /var/lib/dbus/machine-id
+
+  - name: Shut down the bake VM without waiting
+    shell: "sleep 2 && shutdown -h now"
+    async: 1
+    poll: 0
+''')
+    bake_playbook.close()
+    print("Completed writing Ansible BAKE playbook\n-----------------------------------------------------------------")
+
+    print("Applying BAKE playbook...")
+    if run_ansible_playbook("bake", BAKE_DIR + "bake_playbook.yaml", BAKE_DIR + "inventory.ini", cfg_dir=BAKE_DIR) != 0:
+        print("BAKE playbook failed - the bake VM is left running for troubleshooting... exiting")
+        exit(1)
+
+    print("Waiting for the bake VM to shut down...")
+    deadline = time.monotonic() + READY_TIMEOUT
+    while run_command(["virsh", "domstate", "k8-bake"], capture_output=True, text=True).stdout.strip() != "shut off":
+        if time.monotonic() > deadline:
+            print("Bake VM did not shut down... exiting")
+            exit(1)
+        time.sleep(2)
+
+    # Flatten the overlay and its backing baseline into a standalone image, renamed into place once complete
+    print("Writing golden image: " + golden_image)
+    volume_path = run_command(["virsh", "vol-path", "--pool", "disk", "k8-bake.qcow2"], capture_output=True, text=True).stdout.strip()
+    if run_command(["qemu-img", "convert", "-O", "qcow2", volume_path, golden_image + ".tmp"]).returncode != 0:
+        print("Golden image could not be written... exiting")
+        exit(1)
+    os.rename(golden_image + ".tmp", golden_image)
+
+    print("Removing bake VM...")
+    run_command(["terraform", "destroy", "-auto-approve"], cwd=BAKE_DIR, env=env)
+    shutil.rmtree(BAKE_DIR, ignore_errors=True)
+    print("Golden image complete: " + golden_image + "\n-----------------------------------------------------------------")
+
+#-------------------------- END BAKE -------------------------
+
+#----------------------- START TEARDOWN ----------------------
+
+def Teardown():
+    # Destroys the VM's of this build while the terraform state still exists - benchmark runs end with it
+    print("-----------------------------------------------------------------")
+    print("Destroying the cluster VM's")
+    if run_command(["terraform", "destroy", "-auto-approve", "-parallelism=" + str(terraform_parallelism())], env=terraform_env()).returncode != 0:
+        print("Terraform destroy failed - remove the VM's with: terraform destroy... exiting")
+        exit(1)
+    # Nothing generated is applied any more
+    pathlib.Path(ARTIFACT_HASH_FILE).unlink(missing_ok=True)
+    print("Cluster VM's destroyed\n-----------------------------------------------------------------")
+
+#---------------------- FINISH TEARDOWN ----------------------
+
 #----------------------- START CLEAN UP ----------------------
 
 def Cleanup():
@@ -631,35 +2462,711 @@ def Cleanup():
     p1 = pathlib.Path(HOME_DIR + "ansible.cfg")
     p1.unlink(missing_ok=True)
 
-    p1 = pathlib.Path(HOME_DIR + "baseline_playbook.yaml")
+    p1 = pathlib.Path(HOME_DIR + "ansible-performance.cfg")
     p1.unlink(missing_ok=True)
 
-    p1 = pathlib.Path(HOME_DIR + "inventory.ini")
-    p1.unlink(missing_ok=True)
+    path = (HOME_DIR + ".ansible-facts")
+    shutil.rmtree(path, ignore_errors=True)
 
-    p1 = pathlib.Path(HOME_DIR + "terraform.tfstate")
+    path = (HOME_DIR + "callback_plugins")
+    shutil.rmtree(path, ignore_errors=True)
+
+    p1 = pathlib.Path(HOME_DIR + "baseline_playbook.yaml")
     p1.unlink(missing_ok=True)
 
-    p1 = pathlib.Path(HOME_DIR + "terraform.tfstate.backup")
+    p1 = pathlib.Path(HOME_DIR + "inventory.ini")
     p1.unlink(missing_ok=True)
 
     p1 = pathlib.Path(HOME_DIR + "nfs-csi.yaml")
     p1.unlink(missing_ok=True)
 
-    path = (HOME_DIR + "host_vars")
-    shutil.rmtree(path, ignore_errors=True)
-
     p1 = pathlib.Path(HOME_DIR + "k8_playbook.yaml")
     p1.unlink(missing_ok=True)
 
-    p1 = pathlib.Path(HOME_DIR + ".terraform.lock.hcl")
+    p1 = pathlib.Path(TERRAFORM_PLAN)
     p1.unlink(missing_ok=True)
 
     p1 = pathlib.Path(HOME_DIR + "join_playbook.yaml")
     p1.unlink(missing_ok=True)
 
+    p1 = pathlib.Path(RUN_STATE_FILE)
+    p1.unlink(missing_ok=True)
+
     print(f"Files have been cleaned up successfully\n")
 
 #---------------------- FINISH CLEAN UP ----------------------
 
+#----------------------- START READINESS ---------------------
+
+# Ports checked on the VM's for each readiness check
+READY_PORTS = {"ssh": 22, "kubelet": 10250, "apiserver": 6443}
+
+# The API server certificate is signed by the cluster CA - readiness only needs the /readyz answer
+READYZ_CONTEXT = ssl.create_default_context()
+READYZ_CONTEXT.check_hostname = False
+READYZ_CONTEXT.verify_mode = ssl.CERT_NONE
+
+def port_open(ip, port):
+    try:
+        with socket.create_connection((ip, port), timeout=2):
+            return True
+    except OSError:
+        return False
+
+def apiserver_ready(ip):
+    # /readyz answers "ok" once etcd and every API server post-start hook are ready
+    try:
+        with urllib.request.urlopen("https://" + ip + ":" + str(READY_PORTS["apiserver"]) + "/readyz", timeout=2, context=READYZ_CONTEXT) as response:
+            return response.status == 200
+    except OSError:
+        return False
+
+def wait_for_hosts(hosts, checks, label, ips=None, timeout=READY_TIMEOUT):
+    # Polls every host until all of its checks pass, backing off per host between attempts.
+    # checks run in order: "agent_ip" (guest agent reports an IP - the expected one if ips is given),
+    # "ssh", "kubelet" and "apiserver" (port open on the host IP) and "readyz" (API server /readyz answers ok)
+    # Returns {host: ip} once every host is ready - exits if any host runs past its timeout
+    start = time.monotonic()
+    state = {}
+    for host in hosts:
+        state[host] = {"passed": 0, "ip": (ips or {}).get(host), "delay": READY_BACKOFF_START, "next": start}
+    pending = list(hosts)
+    times = READINESS_TIMES.setdefault(label, {})
+
+    while pending:
+        now = time.monotonic()
+        due = [host for host in pending if state[host]["next"] <= now]
+
+        # Query the guest agents of every due host waiting on an IP in one concurrent pass
+        addresses = {}
+        if "agent_ip" in checks:
+            agent_ip_step = checks.index("agent_ip")
+            addresses = discover_addresses([host for host in due if state[host]["passed"] == agent_ip_step])
+
+        # Run the remaining checks of every due host in parallel, stopping each host at its first failure
+        def run_checks(host):
+            host_state = state[host]
+            while host_state["passed"] < len(checks):
+                check = checks[host_state["passed"]]
+                if check == "agent_ip":
+                    agent_ips = addresses.get(host, {}).get("ipv4", [])
+                    if ips and host_state["ip"] not in agent_ips:
+                        return
+                    if not agent_ips:
+                        return
+                    if not ips:
+                        host_state["ip"] = agent_ips[0]
+                elif check == "readyz":
+                    if not (host_state["ip"] and apiserver_ready(host_state["ip"])):
+                        return
+                elif not (host_state["ip"] and port_open(host_state["ip"], READY_PORTS[check])):
+                    return
+                host_state["passed"] += 1
+        if due:
+            with ThreadPoolExecutor(max_workers=min(32, len(due))) as pool:
+                list(pool.map(run_checks, due))
+
+        for host in due:
+            host_state = state[host]
+            elapsed = time.monotonic() - start
+            if host_state["passed"] == len(checks):
+                times[host] = round(elapsed, 1)
+                pending.remove(host)
+                print(f"{host} ready ({', '.join(checks)}) in {elapsed:.1f}s")
+            elif elapsed > timeout:
+                print(f"{host} was not ready after {timeout}s - failed check: {checks[host_state['passed']]}... exiting")
+                exit(1)
+            else:
+                host_state["next"] = time.monotonic() + host_state["delay"]
+                host_state["delay"] = min(host_state["delay"] * 2, READY_BACKOFF_MAX)
+
+        if pending:
+            time.sleep(max(0, min(state[host]["next"] for host in pending) - time.monotonic()))
+
+    print("-----------------------------------------------------------------")
+    return {host: state[host]["ip"] for host in hosts}
+
+def print_readiness_times():
+    print("Readiness times (seconds)")
+    for label, times in READINESS_TIMES.items():
+        for host, seconds in times.items():
+            print(f"  {label:<15}{host:<15}{seconds}")
+    print("-----------------------------------------------------------------")
+
+#------------------------ END READINESS ----------------------
+
+#---------------------- START CLOUD-INIT ---------------------
+
+def ensure_ssh_key():
+    # Generates the keypair once - it is kept between builds so existing VM's stay reachable
+    if not os.path.exists(SSH_KEY):
+        print("Generating SSH keypair: " + SSH_KEY)
+        os.makedirs(os.path.dirname(SSH_KEY), mode=0o700, exist_ok=True)
+        run_command(["ssh-keygen", "-q", "-t", "ed25519", "-N", "", "-C", "k8-on-kvm", "-f", SSH_KEY], check=True)
+
+def ssh_command(ip, command):
+    # Runs a shell command as root in a node with the injected key
+    return run_command(["ssh", "-i", SSH_KEY, "-o", "BatchMode=yes", "-o", "StrictHostKeyChecking=no", "-o", "UserKnownHostsFile=/dev/null",
+                        "-o", "LogLevel=ERROR", "root@" + ip, command], capture_output=True, text=True)
+
+def cloudinit_user_data():
+    # NoCloud user-data, indented for a terraform heredoc - authorizes the SSH key for root
+    public_key = open(SSH_KEY + ".pub").read().strip()
+    return '''    #cloud-config
+    disable_root: false
+    ssh_pwauth: true
+    users:
+      - name: root
+        lock_passwd: false
+        ssh_authorized_keys:
+          - ''' + public_key + "\n"
+
+def cloudinit_network_config(ip):
+    # NoCloud network-config (v2), indented for a terraform heredoc - static address on the first ethernet NIC
+    return '''    version: 2
+    ethernets:
+      primary:
+        match:
+          name: "en*"
+        dhcp4: false
+        addresses:
+          - ''' + ip + "/" + str(NODE_PREFIX) + '''
+        routes:
+          - to: default
+            via: ''' + NODE_GATEWAY + '''
+        nameservers:
+          addresses:
+            - ''' + NODE_DNS + "\n"
+
+#----------------------- END CLOUD-INIT ----------------------
+
+#-------------------- START ANSIBLE RUNNER -------------------
+
+def write_callback_plugin(plugin_dir):
+    # stdout callback printing one JSON event per line - read by run_ansible_playbook
+    os.makedirs(plugin_dir, exist_ok=True)
+    plugin = open(plugin_dir + "k8_events.py", "w")
+    plugin.write('''import json
+import sys
+import time
+
+from ansible.plugins.callback import CallbackBase
+
+
+class CallbackModule(CallbackBase):
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = "stdout"
+    CALLBACK_NAME = "k8_events"
+
+    def __init__(self):
+        super().__init__()
+        self.started = {}
+
+    def emit(self, event, **fields):
+        fields["event"] = event
+        fields["time"] = time.time()
+        sys.stdout.write(json.dumps(fields, default=str) + "\\n")
+        sys.stdout.flush()
+
+    def v2_playbook_on_play_start(self, play):
+        self.emit("play_start", play=play.get_name())
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self.emit("task_start", task=task.get_name())
+
+    def v2_playbook_on_handler_task_start(self, task):
+        self.emit("task_start", task=task.get_name())
+
+    def v2_runner_on_start(self, host, task):
+        self.started[(host.get_name(), task._uuid)] = time.time()
+
+    def result(self, status, result):
+        host = result._host.get_name()
+        started = self.started.pop((host, result._task._uuid), None)
+        fields = {"host": host, "task": result._task.get_name(), "status": status,
+                  "duration": round(time.time() - started, 2) if started else None}
+        if status in ("failed", "unreachable"):
+            output = result._result
+            fields["msg"] = output.get("msg") or output.get("stderr") or output.get("stdout")
+        self.emit("host_result", **fields)
+
+    def v2_runner_on_ok(self, result):
+        self.result("changed" if result._result.get("changed") else "ok", result)
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self.result("ignored" if ignore_errors else "failed", result)
+
+    def v2_runner_on_skipped(self, result):
+        self.result("skipped", result)
+
+    def v2_runner_on_unreachable(self, result):
+        self.result("unreachable", result)
+
+    def v2_playbook_on_stats(self, stats):
+        self.emit("stats", summary={host: stats.summarize(host) for host in sorted(stats.processed)})
+''')
+    plugin.close()
+
+def run_ansible_playbook(name, playbook_path, inventory_path, cfg_dir=HOME_DIR, limit=None):
+    # Runs a playbook with the ansible.cfg of its execution profile. Output is streamed as JSON events from the
+    # k8_events callback and printed as a live per host / per task view - events are logged to LOG_DIR
+    # Returns the ansible-playbook return code
+    profile = ANSIBLE_PLAYBOOK_PROFILES[name]
+    if ARGS.ask_pass:
+        command = ["ansible-playbook", "--user", "root", "--ask-pass", playbook_path]
+    else:
+        command = ["ansible-playbook", "--user", "root", "--private-key", SSH_KEY, playbook_path]
+    if inventory_path:
+        command.extend(["-i", inventory_path])
+    if limit:
+        command.extend(["--limit", limit])
+    env = dict(os.environ, ANSIBLE_CONFIG=cfg_dir + ANSIBLE_CFG_FILES[profile])
+
+    os.makedirs(LOG_DIR, exist_ok=True)
+    events_log = open(LOG_DIR + name + "-events.jsonl", "w")
+    task_times = PLAYBOOK_TASK_TIMES[name] = {}
+    start = time.monotonic()
+    returncode = None
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1, env=env)
+        for line in process.stdout:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                # Warnings and errors from ansible itself are passed through as they are
+                print(line, end="")
+                continue
+            events_log.write(line)
+            events_log.flush()
+            print_ansible_event(event, task_times)
+        returncode = process.wait()
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return 1
+    finally:
+        events_log.close()
+        record_command("ansible-playbook " + name, time.monotonic() - start, returncode)
+
+    elapsed = time.monotonic() - start
+    PLAYBOOK_TIMES[name] = (profile, round(elapsed, 1))
+    print(f"{name} playbook finished in {elapsed:.1f}s ({profile} profile)")
+    print_task_times(name, task_times)
+    return process.returncode
+
+def print_ansible_event(event, task_times):
+    if event["event"] == "play_start":
+        print("PLAY [" + event["play"] + "]")
+    elif event["event"] == "task_start":
+        print("TASK [" + event["task"] + "]")
+    elif event["event"] == "host_result":
+        duration = event.get("duration")
+        if duration is not None:
+            task_times.setdefault(event["host"], []).append((event["task"], duration))
+        line = f"  {event['host']:<15}{event['status']:<12}{duration if duration is not None else '-':>8}s  {event['task']}"
+        if event.get("msg"):
+            line += " - " + str(event["msg"]).strip()
+        print(line)
+    elif event["event"] == "stats":
+        for host, summary in event["summary"].items():
+            print(f"  {host:<15}" + "  ".join(f"{key}={value}" for key, value in summary.items()))
+
+def print_task_times(name, task_times, count=5):
+    # Prints the slowest tasks of every host and writes the full table to LOG_DIR
+    print(f"Slowest {name} playbook tasks per host (seconds)")
+    for host, times in task_times.items():
+        for task, seconds in sorted(times, key=lambda item: item[1], reverse=True)[:count]:
+            print(f"  {host:<15}{seconds:>8}  {task}")
+    print("-----------------------------------------------------------------")
+    timing_file = open(LOG_DIR + name + "-task-times.json", "w")
+    json.dump(task_times, timing_file, indent=2)
+    timing_file.close()
+
+def task_seconds(playbook, host, task):
+    # Seconds a host spent in one task of a playbook run
+    return round(sum(seconds for name, seconds in PLAYBOOK_TASK_TIMES.get(playbook, {}).get(host, []) if name == task), 2)
+
+def print_playbook_times():
+    print("Playbook times (seconds)")
+    for name, (profile, seconds) in PLAYBOOK_TIMES.items():
+        print(f"  {name:<15}{profile:<15}{seconds}")
+    print("-----------------------------------------------------------------")
+
+#--------------------- END ANSIBLE RUNNER --------------------
+
+#----------------------- START REPORTING ---------------------
+
+def run_command(args, **kwargs):
+    # subprocess.run that records the command time against the running phase for the run report
+    start = time.monotonic()
+    returncode = None
+    try:
+        result = subprocess.run(args, **kwargs)
+        returncode = result.returncode
+        return result
+    finally:
+        record_command(" ".join(args[:2]), time.monotonic() - start, returncode)
+
+def record_command(command, seconds, returncode):
+    # Repeated commands (polling) are summed into one entry per phase
+    times = COMMAND_TIMES.setdefault(CURRENT_PHASE or "-", {}).setdefault(command, {"count": 0, "seconds": 0, "failed": 0})
+    times["count"] += 1
+    times["seconds"] = round(times["seconds"] + seconds, 2)
+    if returncode != 0:
+        times["failed"] += 1
+
+def run_phase(phase):
+    global CURRENT_PHASE
+    CURRENT_PHASE = phase.__name__
+    start = time.monotonic()
+    try:
+        return phase()
+    finally:
+        PHASE_TIMES[phase.__name__] = round(time.monotonic() - start, 1)
+        CURRENT_PHASE = None
+
+def write_report(name, report):
+    # Writes a report to --report FILE, or to LOG_DIR as [name]-[date].json, and returns its path
+    report_path = ARGS.report or LOG_DIR + name + "-" + report["date"].replace(":", "") + ".json"
+    os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+    report_file = open(report_path, "w")
+    json.dump(report, report_file, indent=2)
+    report_file.close()
+    return report_path
+
+def write_run_report(status, total):
+    # Machine readable report of the run - the benchmark command reads these back
+    date = time.strftime("%Y-%m-%dT%H:%M:%S")
+    report = {
+        "date": date,
+        "command": ARGS.command,
+        "status": status,
+        "workers": ARGS.workers,
+        "clone_mode": ARGS.clone_mode,
+        "mirror": bool(ARGS.mirror),
+        "no_golden": ARGS.no_golden,
+        "ansible_profiles": ANSIBLE_PLAYBOOK_PROFILES,
+        "node_roles": NODE_ROLES,
+        "node_sizes": ROLE_SIZES,
+        "cpu_profiles": ROLE_CPU_PROFILES,
+        "disk_profiles": ROLE_DISK_PROFILES,
+        "data_disks": ROLE_DATA_DISKS,
+        "net_profiles": ROLE_NET_PROFILES,
+        "density": ARGS.density,
+        "local_storage_gib": ARGS.local_storage,
+        "nfs_mount_profile": ARGS.nfs_mount_profile,
+        "nfs_storage_classes": NFS_STORAGE_CLASSES,
+        "etcd_disk": ETCD_DISK,
+        "etcd_check": ETCD_CHECK,
+        "total_seconds": round(total, 1),
+        "phases": PHASE_TIMES,
+        "skipped_phases": SKIPPED_PHASES,
+        "commands": COMMAND_TIMES,
+        "playbooks": {name: {"profile": profile, "seconds": seconds} for name, (profile, seconds) in PLAYBOOK_TIMES.items()},
+        "tasks": PLAYBOOK_TASK_TIMES,
+        "terraform_resources": TERRAFORM_RESOURCE_TIMES,
+        "readiness": READINESS_TIMES,
+        "kubeadm_init_seconds": task_seconds("k8", "master-001", "Initialize K8 Cluster"),
+        "join": JOIN_TIMES,
+    }
+    report_path = write_report("run", report)
+
+    print("Phase times (seconds)")
+    for phase, seconds in PHASE_TIMES.items():
+        print(f"  {phase:<20}{seconds:>10}")
+    print(f"  {'Total (' + status + ')':<20}{round(total, 1):>10}")
+    print("Run report written to " + report_path)
+    print("-----------------------------------------------------------------")
+
+#------------------------ END REPORTING ----------------------
+
+#---------------------- START CHECKPOINTS --------------------
+
+def save_run_state(state):
+    state_file = open(RUN_STATE_FILE, "w")
+    json.dump(state, state_file, indent=2)
+    state_file.close()
+
+def checkpoint(state, phase, hosts):
+    # Records a finished phase and the hosts (with their IP's) it finished for
+    state["phases"][phase] = {"date": time.strftime("%Y-%m-%dT%H:%M:%S"), "hosts": hosts}
+    save_run_state(state)
+
+def phase_is_live(phase, hosts):
+    # Checks that the result of a finished phase still exists on the VM's
+    if phase == "Terraform":
+        return os.path.exists(HOME_DIR + "terraform.tfstate") and all(
+            run_command(["virsh", "domstate", host], capture_output=True, text=True).stdout.strip() == "running" for host in hosts)
+    if phase in ("Ansible_Prep", "Ansible_Baseline"):
+        return os.path.exists(HOME_DIR + "inventory.ini") and all(port_open(NODE_IPS[host], READY_PORTS["ssh"]) for host in hosts)
+    if phase == "Ansible_K8_Config":
+        return apiserver_ready(MASTER_IP)
+    if phase == "Ansible_K8_Join":
+        return all(port_open(NODE_IPS[host], READY_PORTS["kubelet"]) for host in hosts if host.startswith("worker"))
+    return False
+
+def start_run_state(phases):
+    # Returns the run state and the index of the first phase to run
+    # A new build starts a new state - --resume continues after the last finished phase that is still live
+    if not ARGS.resume or not os.path.exists(RUN_STATE_FILE):
+        if ARGS.resume:
+            print("No run state found in " + RUN_STATE_FILE + " - starting from the beginning")
+        state = {"topology": NODE_IPS, "phases": {}}
+        save_run_state(state)
+        return state, 0
+
+    state_file = open(RUN_STATE_FILE)
+    state = json.load(state_file)
+    state_file.close()
+    if state["topology"] != NODE_IPS:
+        print("The run state is for a different topology " + str(state["topology"]) + " - use the same --workers and --ip-range... exiting")
+        exit(1)
+
+    print("Checking the phases finished by the last run...")
+    first = 0
+    for index in reversed(range(len(phases))):
+        name = phases[index].__name__
+        if name in state["phases"] and phase_is_live(name, state["phases"][name]["hosts"]):
+            first = index + 1
+            break
+    for phase in phases[:first]:
+        print("  " + phase.__name__ + ": finished " + state["phases"][phase.__name__]["date"] + " - skipping")
+        SKIPPED_PHASES.append(phase.__name__)
+    # Phases after the resume point run again and are recorded again
+    for phase in phases[first:]:
+        state["phases"].pop(phase.__name__, None)
+    save_run_state(state)
+    print("-----------------------------------------------------------------")
+    return state, first
+
+#----------------------- END CHECKPOINTS ---------------------
+
+#------------------- START CHANGE DETECTION ------------------
+
+def load_artifact_hashes():
+    if not os.path.exists(ARTIFACT_HASH_FILE):
+        return {}
+    hash_file = open(ARTIFACT_HASH_FILE)
+    hashes = json.load(hash_file)
+    hash_file.close()
+    return hashes
+
+def artifact_hash(name):
+    return hashlib.sha256(pathlib.Path(HOME_DIR + name).read_bytes()).hexdigest()
+
+def artifact_unchanged(name):
+    # True when the generated file is the one that was last applied successfully (never with --force)
+    return not ARGS.force and load_artifact_hashes().get(name) == artifact_hash(name)
+
+def record_artifact(name):
+    # Records a successful apply - the artifacts applied after this one have to be applied again
+    hashes = load_artifact_hashes()
+    hashes[name] = artifact_hash(name)
+    for later in ARTIFACT_ORDER[ARTIFACT_ORDER.index(name) + 1:]:
+        hashes.pop(later, None)
+    hash_file = open(ARTIFACT_HASH_FILE, "w")
+    json.dump(hashes, hash_file, indent=2)
+    hash_file.close()
+
+#-------------------- END CHANGE DETECTION -------------------
+
+#----------------------- START BENCHMARK ---------------------
+
+def benchmark_build_args(report_path):
+    # Command line of one benchmark build - same topology and options as the benchmark, unattended, destroyed at the end
+    build_args = ["build", "--auto-approve", "--teardown", "--report", report_path,
+                  "--workers", str(ARGS.workers), "--ip-range", ARGS.ip_range, "--clone-mode", ARGS.clone_mode]
+    if ARGS.mirror:
+        build_args.extend(["--mirror", ARGS.mirror])
+    if ARGS.no_golden:
+        build_args.append("--no-golden")
+    if ARGS.ask_pass:
+        build_args.append("--ask-pass")
+    for selection in ARGS.ansible_profile:
+        build_args.extend(["--ansible-profile", selection])
+    if ARGS.tf_parallelism > 0:
+        build_args.extend(["--tf-parallelism", str(ARGS.tf_parallelism)])
+    if ARGS.join_parallelism > 0:
+        build_args.extend(["--join-parallelism", str(ARGS.join_parallelism)])
+    build_args.extend(["--logging-workers", str(ARGS.logging_workers)])
+    for selection in ARGS.node_size:
+        build_args.extend(["--node-size", selection])
+    for selection in ARGS.cpu_profile:
+        build_args.extend(["--cpu-profile", selection])
+    for selection in ARGS.disk_profile:
+        build_args.extend(["--disk-profile", selection])
+    for selection in ARGS.data_disk:
+        build_args.extend(["--data-disk", selection])
+    for selection in ARGS.net_profile:
+        build_args.extend(["--net-profile", selection])
+    if ARGS.density:
+        build_args.append("--density")
+    if ARGS.local_storage:
+        build_args.extend(["--local-storage", str(ARGS.local_storage)])
+    build_args.extend(["--nfs-mount-profile", ARGS.nfs_mount_profile])
+    for selection in ARGS.nfs_class:
+        build_args.extend(["--nfs-class", selection])
+    if ARGS.etcd_disk:
+        build_args.extend(["--etcd-disk", ARGS.etcd_disk])
+    for selection in ARGS.etcd_arg:
+        build_args.extend(["--etcd-arg", selection])
+    if ARGS.etcd_check:
+        build_args.append("--etcd-check")
+    return build_args
+
+def benchmark_config():
+    # Hash of the build options of a benchmark - only runs with the same options are compared
+    build_args = benchmark_build_args("")
+    index = build_args.index("--report")
+    del build_args[index:index + 2]
+    return hashlib.sha256(json.dumps(build_args).encode()).hexdigest()[:12], build_args
+
+def read_benchmark_history():
+    history = []
+    if os.path.exists(BENCHMARK_HISTORY):
+        for line in open(BENCHMARK_HISTORY):
+            if line.strip():
+                history.append(json.loads(line))
+    return history
+
+def median_times(reports):
+    # {"Total": s, phase: s} - median over the reports that have the phase
+    times = {"Total": statistics.median(report["total_seconds"] for report in reports)}
+    for phase in dict.fromkeys(phase for report in reports for phase in report["phases"]):
+        times[phase] = statistics.median(report["phases"][phase] for report in reports if phase in report["phases"])
+    return times
+
+def Benchmark():
+    if ARGS.runs < 1:
+        print("--runs must be at least 1... exiting")
+        exit(1)
+    os.makedirs(LOG_DIR, exist_ok=True)
+    config, config_args = benchmark_config()
+    # Runs of other options (workers, profiles, clone mode, mirror...) or from before the config was recorded are not comparable
+    history = [report for report in read_benchmark_history() if report["status"] == "succeeded" and report.get("benchmark_config") == config]
+    baseline = median_times(history[-BENCHMARK_BASELINE_RUNS:]) if history else None
+
+    reports = []
+    for run in range(1, ARGS.runs + 1):
+        print(f"Benchmark run {run} of {ARGS.runs}\n-----------------------------------------------------------------")
+        report_path = LOG_DIR + "benchmark-run-" + str(run) + ".json"
+        pathlib.Path(report_path).unlink(missing_ok=True)
+        run_command([sys.executable, os.path.abspath(__file__)] + benchmark_build_args(report_path))
+        if not os.path.exists(report_path):
+            print("Benchmark run " + str(run) + " did not write a report... exiting")
+            exit(1)
+        report_file = open(report_path)
+        report = json.load(report_file)
+        report_file.close()
+        report["benchmark_config"] = config
+        report["benchmark_args"] = config_args
+        history_file = open(BENCHMARK_HISTORY, "a")
+        history_file.write(json.dumps(report) + "\n")
+        history_file.close()
+        if report["status"] != "succeeded":
+            print("Benchmark run " + str(run) + " failed - the VM's may still exist, remove them with: terraform destroy... exiting")
+            exit(1)
+        reports.append(report)
+
+    current = median_times(reports)
+    print(f"Benchmark of {ARGS.runs} run(s), median seconds - history in " + BENCHMARK_HISTORY)
+    if baseline is None:
+        for name, seconds in current.items():
+            print(f"  {name:<20}{seconds:>10}")
+        print("No comparable baseline - no earlier run in the history with the same build options (config " + config + "), "
+              "these runs are the baseline for the next benchmark with them")
+        print("-----------------------------------------------------------------")
+        return
+
+    regressions = []
+    print(f"  {'':<20}{'baseline':>10}{'now':>10}{'change':>10}")
+    for name, seconds in current.items():
+        if name not in baseline:
+            print(f"  {name:<20}{'-':>10}{seconds:>10}")
+            continue
+        change = (seconds - baseline[name]) / baseline[name] * 100 if baseline[name] else 0
+        flag = ""
+        if change > ARGS.regression_threshold and seconds - baseline[name] > REGRESSION_MIN_SECONDS:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"  {name:<20}{baseline[name]:>10}{seconds:>10}{change:>+9.1f}%{flag}")
+    print("-----------------------------------------------------------------")
+    if regressions:
+        print("Slower than the baseline by more than " + str(ARGS.regression_threshold) + "%: " + ", ".join(regressions))
+        exit(1)
+
+#------------------------ END BENCHMARK ----------------------
+
+#----------------------- START DISCOVERY ---------------------
+
+# Single libvirt connection shared by every discovery pass
+LIBVIRT_CONN = None
+
+def libvirt_connection():
+    global LIBVIRT_CONN
+    if LIBVIRT_CONN is None:
+        # Guest agents that are not up yet raise errors - don't print them on every poll
+        libvirt.registerErrorHandler(lambda ctx, err: None, None)
+        LIBVIRT_CONN = libvirt.open("qemu:///system")
+    return LIBVIRT_CONN
+
+def agent_interface_libvirt(conn, host):
+    try:
+        domain = conn.lookupByName(host)
+        interfaces = domain.interfaceAddresses(libvirt.VIR_DOMAIN_INTERFACE_ADDRESSES_SRC_AGENT)
+    except libvirt.libvirtError:
+        return {}
+    for ifname, iface in interfaces.items():
+        ipv4 = [addr["addr"] for addr in (iface.get("addrs") or [])
+                if addr["type"] == libvirt.VIR_IP_ADDR_TYPE_IPV4 and not addr["addr"].startswith("127.")]
+        if ifname != "lo" and ipv4:
+            return {"ipv4": ipv4, "mac": iface.get("hwaddr"), "interface": ifname}
+    return {}
+
+def agent_interface_virsh(host):
+    virsh_cmd = run_command(["virsh", "domifaddr", host, "--source", "agent"], capture_output=True, text=True)
+    if virsh_cmd.returncode != 0:
+        return {}
+
+    # Rows are: Name MAC Protocol Address - a name of "-" continues the previous interface
+    interfaces = {}
+    ifname = None
+    for line in virsh_cmd.stdout.strip().split('\n')[2:]:
+        fields = line.split()
+        if len(fields) != 4:
+            continue
+        if fields[0] != "-":
+            ifname = fields[0]
+            interfaces[ifname] = {"ipv4": [], "mac": fields[1], "interface": ifname}
+        if ifname and fields[2] == "ipv4" and not fields[3].startswith("127."):
+            interfaces[ifname]["ipv4"].append(fields[3].split("/")[0])
+    for ifname, iface in interfaces.items():
+        if ifname != "lo" and iface["ipv4"]:
+            return iface
+    return {}
+
+def discover_addresses(hosts):
+    # Queries the guest agent of every host concurrently
+    # Returns {host: {"ipv4": [...], "mac": ..., "interface": ...}} - hosts without an agent IP map to {}
+    if not hosts:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(32, len(hosts))) as pool:
+        if libvirt:
+            conn = libvirt_connection()
+            results = pool.map(lambda host: agent_interface_libvirt(conn, host), hosts)
+        else:
+            results = pool.map(agent_interface_virsh, hosts)
+        return dict(zip(hosts, results))
+
+def write_inventory(ips):
+    # ips: {host: ip} - hosts are grouped by role
+    ansible_inv = open(HOME_DIR + "inventory.ini", "w")
+    for group in ["master", "worker"]:
+        ansible_inv.write("[" + group + "]\n")
+        for host, ip in ips.items():
+            if host.startswith(group):
+                ansible_inv.write(host + " ansible_host=" + ip + "\n")
+    ansible_inv.close()
+
+#------------------------ END DISCOVERY ----------------------
+
 main_function()
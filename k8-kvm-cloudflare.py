@@ -17,6 +17,8 @@ import subprocess
 import re           # used for searching Tunnel ID
 import time         # used to wait
 import pathlib      # used for deleting files
+import hashlib      # used for detecting changed helm releases
+import json         # used for storing release hashes
 
 print("\nVersion: 1.0.1\n----------------------------------------------------------\n")
 print("NOTE: If this is a fresh K8 install, the master node should be rebooted one more time\n")
@@ -33,6 +35,8 @@ print("----------------------------------------------------------")
 
 HOME_DIR = os.path.expanduser("~/")
 
+# sha256 of the manifest / command of every helm release at its last successful install - kept between runs
+ARTIFACT_HASH_FILE = HOME_DIR + ".k8-kvm-cloudflare-hashes.json"
 
 # Execute script in order of functions defined here
 #--------------------------------------------------
@@ -49,34 +53,40 @@ def CloudFlareSetup():
     
     tunnel_name = input("Enter a name for your tunnel (Eg. home-lab, etc): ")
     print("----------------------------------------------------------")
-    # Create Cloudflare API Token Secret
-    try:
-        # Command(s) to be executed inside a single subprocess shell
-        command = "cloudflared tunnel create " + tunnel_name
-        subprocess.run(command, shell=True, check=True)
-        print("\nThe tunnel has been created successfully\n\nNavigate to the cloudflare dashboard and modify the SSL/TLS Encryption Mode to FULL and make sure there is a 'Universal' certificate\n----------------------------------------------------------")
-    except subprocess.CalledProcessError as e:
-        print(f"An error occurred: {e}----------------------------------------------------------")
+    # A rerun keeps the tunnel and credentials secret of the earlier run - no new tunnel, no prompts
+    tunnel_id = existing_tunnel(tunnel_name)
+    if tunnel_id:
+        print("Tunnel " + tunnel_name + " (" + tunnel_id + ") and its tunnel-credentials secret exist... skipping tunnel creation\n----------------------------------------------------------")
+    else:
+        # Create Cloudflare API Token Secret
+        try:
+            # Command(s) to be executed inside a single subprocess shell
+            command = "cloudflared tunnel create " + tunnel_name
+            subprocess.run(command, shell=True, check=True)
+            print("\nThe tunnel has been created successfully\n\nNavigate to the cloudflare dashboard and modify the SSL/TLS Encryption Mode to FULL and make sure there is a 'Universal' certificate\n----------------------------------------------------------")
+        except subprocess.CalledProcessError as e:
+            print(f"An error occurred: {e}----------------------------------------------------------")
+
+        input("\nHit ENTER once complete...\n")
 
-    input("\nHit ENTER once complete...\n")
-
-    print("----------------------------------------------------------")
-    print("Obtaining JSON file from " + HOME_DIR + ".cloudflared/")
-    path = HOME_DIR + ".cloudflared/"
-    cf_json_file = os.listdir(path)
-
-    # Create Cloudflare Tunnel Secret
-    print("Creating Cloudflare Tunnel Kubernetes Secret")
-    try:
-        # Command(s) to be executed inside a single subprocess shell
-        command = "kubectl create secret generic tunnel-credentials --from-file=credentials.json=" + HOME_DIR + ".cloudflared/" + cf_json_file[1] + " --namespace=cloudflare"
-        subprocess.run(command, shell=True, check=True)
         print("----------------------------------------------------------")
-    except subprocess.CalledProcessError as e:
-        print(f"An error occurred: {e}----------------------------------------------------------")
+        print("Obtaining JSON file from " + HOME_DIR + ".cloudflared/")
+        path = HOME_DIR + ".cloudflared/"
+        cf_json_file = os.listdir(path)
+
+        # Create Cloudflare Tunnel Secret
+        print("Creating Cloudflare Tunnel Kubernetes Secret")
+        try:
+            # Command(s) to be executed inside a single subprocess shell
+            command = "kubectl create secret generic tunnel-credentials --from-file=credentials.json=" + HOME_DIR + ".cloudflared/" + cf_json_file[1] + " --namespace=cloudflare"
+            subprocess.run(command, shell=True, check=True)
+            print("----------------------------------------------------------")
+        except subprocess.CalledProcessError as e:
+            print(f"An error occurred: {e}----------------------------------------------------------")
     
-    print("Provide your Cloudflare Tunnel ID")
-    tunnel_id = input("NOTE: This was provided earlier: ")
+        print("Provide your Cloudflare Tunnel ID")
+        tunnel_id = input("NOTE: This was provided earlier: ")
+
     domain_name = input("Provide your Cloudflare Domain Name: ")
 
     print("----------------------------------------------------------")
@@ -107,14 +117,16 @@ replicaCount: 1"""
     print("Finished creating the manifest\n----------------------------------------------------------")
 
    # Establish Cloudflare Tunnel
-    print("Integrating Cloudflare Tunnel with Kubernetes")
-    try:
-        # Command(s) to be executed inside a single subprocess shell
-        command = "helm upgrade --install cloudflare cloudflare/cloudflare-tunnel --namespace cloudflare --values tunnel-manifest.yaml --wait"
-        subprocess.run(command, shell=True, check=True)
-        print("----------------------------------------------------------")
-    except subprocess.CalledProcessError as e:
-        print(f"An error occurred: {e}----------------------------------------------------------")
+    if artifact_changed("cloudflare", manifest_string, "helm status cloudflare -n cloudflare"):
+        print("Integrating Cloudflare Tunnel with Kubernetes")
+        try:
+            # Command(s) to be executed inside a single subprocess shell
+            command = "helm upgrade --install cloudflare cloudflare/cloudflare-tunnel --namespace cloudflare --values tunnel-manifest.yaml --wait"
+            subprocess.run(command, shell=True, check=True)
+            record_artifact("cloudflare", manifest_string)
+            print("----------------------------------------------------------")
+        except subprocess.CalledProcessError as e:
+            print(f"An error occurred: {e}----------------------------------------------------------")
 
     # Check deployment status
     def k8_deploy_chk():
@@ -133,14 +145,16 @@ replicaCount: 1"""
     print("----------------------------------------------------------")
 
     # Adding external DNS
-    try:
-        # Command(s) to be executed inside a single subprocess shell
-        print("Installing External DNS (used to manage sub-domains in Cloudflare)")
-        command = "helm upgrade --install external-dns kubernetes-sigs/external-dns --namespace cloudflare --set sources[0]=ingress --set policy=sync --set provider.name=cloudflare --set env[0].name=CF_API_TOKEN --set env[0].valueFrom.secretKeyRef.name=cloudflare-api-key --set env[0].valueFrom.secretKeyRef.key=apiKey --wait"
-        subprocess.run(command, shell=True, check=True)
-        print("...Installed External DNS successfully\n----------------------------------------------------------\n")
-    except subprocess.CalledProcessError as e:
-        print(f"An error occurred installing External DNS: {e}----------------------------------------------------------")
+    command = "helm upgrade --install external-dns kubernetes-sigs/external-dns --namespace cloudflare --set sources[0]=ingress --set policy=sync --set provider.name=cloudflare --set env[0].name=CF_API_TOKEN --set env[0].valueFrom.secretKeyRef.name=cloudflare-api-key --set env[0].valueFrom.secretKeyRef.key=apiKey --wait"
+    if artifact_changed("external-dns", command, "helm status external-dns -n cloudflare"):
+        try:
+            # Command(s) to be executed inside a single subprocess shell
+            print("Installing External DNS (used to manage sub-domains in Cloudflare)")
+            subprocess.run(command, shell=True, check=True)
+            record_artifact("external-dns", command)
+            print("...Installed External DNS successfully\n----------------------------------------------------------\n")
+        except subprocess.CalledProcessError as e:
+            print(f"An error occurred installing External DNS: {e}----------------------------------------------------------")
 
     # Check deployment status
     def k8_dns_chk():
@@ -201,13 +215,15 @@ def CloudFlareInstall():
         print(f"An error occurred: {e}----------------------------------------------------------")
 
     # Install nginx-controller as default ingress
-    try:    
-        print("Adding Kubernetes Nginx-Ingress as default Ingress")
-        command = "helm upgrade -i ingress-nginx ingress-nginx/ingress-nginx --namespace kube-system --set controller.service.type=ClusterIP --set controller.ingressClassResource.default=true --wait"
-        subprocess.run(command, shell=True, check=True)
-        print("...Created Kubernetes Nginx-Ingress successfully\n----------------------------------------------------------\n")
-    except subprocess.CalledProcessError as e:
-        print(f"An error occurred: {e}----------------------------------------------------------")
+    command = "helm upgrade -i ingress-nginx ingress-nginx/ingress-nginx --namespace kube-system --set controller.service.type=ClusterIP --set controller.ingressClassResource.default=true --wait"
+    if artifact_changed("ingress-nginx", command, "helm status ingress-nginx -n kube-system"):
+        try:    
+            print("Adding Kubernetes Nginx-Ingress as default Ingress")
+            subprocess.run(command, shell=True, check=True)
+            record_artifact("ingress-nginx", command)
+            print("...Created Kubernetes Nginx-Ingress successfully\n----------------------------------------------------------\n")
+        except subprocess.CalledProcessError as e:
+            print(f"An error occurred: {e}----------------------------------------------------------")
 
 #----------------------- END CLOUDFLARE INSTALL -----------------------
 
@@ -316,6 +332,48 @@ def MasterNodePrep():
 
 #-------------------- END MASTER NODE PREP -----------------------
 
+#------------------- START CHANGE DETECTION ----------------------
+
+def load_artifact_hashes():
+    if not os.path.exists(ARTIFACT_HASH_FILE):
+        return {}
+    hash_file = open(ARTIFACT_HASH_FILE)
+    hashes = json.load(hash_file)
+    hash_file.close()
+    return hashes
+
+def artifact_changed(name, content, check_command):
+    # True when the release content differs from the last install, or the release is gone from the cluster
+    if load_artifact_hashes().get(name) == hashlib.sha256(content.encode()).hexdigest():
+        if subprocess.run(check_command, shell=True, capture_output=True).returncode == 0:
+            print(name + " unchanged since its last install... skipping\n----------------------------------------------------------")
+            return False
+    return True
+
+def existing_tunnel(tunnel_name):
+    # ID of the tunnel when it exists in the Cloudflare account and its credentials secret is in the cluster, else None
+    process = subprocess.run(["cloudflared", "tunnel", "list", "--output", "json", "--name", tunnel_name], capture_output=True, text=True)
+    secret = subprocess.run(["kubectl", "get", "secret", "tunnel-credentials", "--namespace=cloudflare"], capture_output=True)
+    if process.returncode != 0 or secret.returncode != 0:
+        return None
+    try:
+        tunnels = json.loads(process.stdout or "[]")
+    except ValueError:
+        return None
+    for tunnel in tunnels or []:
+        if tunnel.get("name") == tunnel_name:
+            return tunnel.get("id")
+    return None
+
+def record_artifact(name, content):
+    hashes = load_artifact_hashes()
+    hashes[name] = hashlib.sha256(content.encode()).hexdigest()
+    hash_file = open(ARTIFACT_HASH_FILE, "w")
+    json.dump(hashes, hash_file, indent=2)
+    hash_file.close()
+
+#-------------------- END CHANGE DETECTION -----------------------
+
 #----------------------- START CLEAN UP --------------------------
 
 def Cleanup():
@@ -3,6 +3,7 @@
 #######################################
 # Config_Create         Creates the repository and all the installation / values files
 # Stack_Install         Installs ES, ES Operator, Kibana, Fluent Operator, Fluentbit
+#                       ES data goes on the node-local "local-storage" class of the logging workers when it exists
 # Cleanup:              Removes only files and dir's created by this script
 #
 #######################################
@@ -11,6 +12,8 @@ import os
 import subprocess
 import time         # used to wait for obtaining IP
 import pathlib      # used for deleting files
+import hashlib      # used for detecting changed manifests
+import json         # used for storing manifest hashes
 
 print("\nVersion: 1.0.1\n----------------------------------------------------------\n")
 print("REMINDERS\n - This will be installed into the 'logging' namespace\n - There will various delays between package installations\n")
@@ -26,6 +29,14 @@ print("----------------------------------------------------------")
 
 HOME_DIR = os.path.expanduser("~/")
 
+# sha256 of every generated manifest / values file at its last successful apply - kept between runs
+ARTIFACT_HASH_FILE = HOME_DIR + ".k8-kvm-efk-hashes.json"
+
+# Node-local StorageClass and node role label created by "k8-create.py --local-storage" - Elasticsearch data is
+# placed there when the cluster has it, on the nfs-csi default class otherwise
+ES_LOCAL_STORAGE_CLASS = "local-storage"
+ES_NODE_ROLE_LABEL = "k8-on-kvm/role"
+ES_MAX_MAP_COUNT = "262144"
 
 # Execute script in order of functions defined here
 #--------------------------------------------------
@@ -48,51 +59,58 @@ def Cert_Install():
     except subprocess.CalledProcessError as e:
         print(f"An error occurred: {e}\n----------------------------------------------------------")
 
-# Create secret for cert manager
-    print("Creating Secret for Cert-Manager...\n\n")
-
-    apiKey = input("Provide your Cloudflare API key/token: ")
-    apiEmail = input("Provide your Cloudflare Email Address: ")
+# Create secret for cert manager - only asked for when it does not exist yet
+    if not k8_object_exists("kubectl get secret cloudflare-api-key -n cert-manager"):
+        print("Creating Secret for Cert-Manager...\n\n")
 
-    try:
-        # Command(s) to be executed inside a single subprocess shell
-        command = "kubectl create secret generic cloudflare-api-key --from-literal=apiKey=" + apiKey + " --from-literal=email=" + apiEmail + " --namespace=cert-manager"
-        subprocess.run(command, shell=True, check=True)
-        print("...Created Secret for Cert-Manager successfully\n----------------------------------------------------------")
-    except subprocess.CalledProcessError as e:
-        print(f"An error occurred: {e}\n----------------------------------------------------------")
+        apiKey = input("Provide your Cloudflare API key/token: ")
+        apiEmail = input("Provide your Cloudflare Email Address: ")
 
-    def countdown(minutes, seconds):
-        total_seconds = minutes * 60 + seconds
-        while total_seconds > 0:
-            mins, secs = divmod(total_seconds, 60)
-            timer = '{:02d}:{:02d}'.format(mins, secs)
-            print(timer, end="\r")
-            time.sleep(1)
-            total_seconds -= 1
-    minutes = int("0")
-    seconds = int("15")
-    countdown(minutes, seconds)
+        try:
+            # Command(s) to be executed inside a single subprocess shell
+            command = "kubectl create secret generic cloudflare-api-key --from-literal=apiKey=" + apiKey + " --from-literal=email=" + apiEmail + " --namespace=cert-manager"
+            subprocess.run(command, shell=True, check=True)
+            print("...Created Secret for Cert-Manager successfully\n----------------------------------------------------------")
+        except subprocess.CalledProcessError as e:
+            print(f"An error occurred: {e}\n----------------------------------------------------------")
+    else:
+        print("Secret for Cert-Manager already exists... skipping\n----------------------------------------------------------")
 
 # Create clusterIssuer
-    print("Applying ClusterIssuer manifest...")
-    try:
-        # Command(s) to be executed inside a single subprocess shell
-        command = "kubectl apply -f clusterIssuer-manifest.yaml"
-        subprocess.run(command, shell=True, check=True)
-        print("...applied ClusterIssuer manifest successfully\n----------------------------------------------------------")
-    except subprocess.CalledProcessError as e:
-        print(f"An error occurred: {e}\n----------------------------------------------------------")
+    if artifact_changed("clusterIssuer-manifest.yaml", "kubectl get clusterissuer cloudflare-letsencrypt"):
+        def countdown(minutes, seconds):
+            total_seconds = minutes * 60 + seconds
+            while total_seconds > 0:
+                mins, secs = divmod(total_seconds, 60)
+                timer = '{:02d}:{:02d}'.format(mins, secs)
+                print(timer, end="\r")
+                time.sleep(1)
+                total_seconds -= 1
+        minutes = int("0")
+        seconds = int("15")
+        countdown(minutes, seconds)
+
+        print("Applying ClusterIssuer manifest...")
+        try:
+            # Command(s) to be executed inside a single subprocess shell
+            command = "kubectl apply -f clusterIssuer-manifest.yaml"
+            subprocess.run(command, shell=True, check=True)
+            record_artifact("clusterIssuer-manifest.yaml")
+            print("...applied ClusterIssuer manifest successfully\n----------------------------------------------------------")
+        except subprocess.CalledProcessError as e:
+            print(f"An error occurred: {e}\n----------------------------------------------------------")
 
 # Apply kibana ingress
-    print("Applying Kibana Ingress...")
-    try:
-        # Command(s) to be executed inside a single subprocess shell
-        command = "kubectl apply -f kibana-ingress.yaml"
-        subprocess.run(command, shell=True, check=True)
-        print("...applied Kibana successfully\n----------------------------------------------------------")
-    except subprocess.CalledProcessError as e:
-        print(f"An error occurred: {e}\n----------------------------------------------------------")
+    if artifact_changed("kibana-ingress.yaml", "kubectl get ingress kibana-ingress -n logging"):
+        print("Applying Kibana Ingress...")
+        try:
+            # Command(s) to be executed inside a single subprocess shell
+            command = "kubectl apply -f kibana-ingress.yaml"
+            subprocess.run(command, shell=True, check=True)
+            record_artifact("kibana-ingress.yaml")
+            print("...applied Kibana successfully\n----------------------------------------------------------")
+        except subprocess.CalledProcessError as e:
+            print(f"An error occurred: {e}\n----------------------------------------------------------")
 
 #------------------------- END CERT INSTALL ------------------------
 
@@ -104,67 +122,63 @@ def Stack_Install():
     print("Installing Elasticsearch Operator...")
     try:
         # Command(s) to be executed inside a single subprocess shell
-        command = "helm install elastic-operator elastic/eck-operator -n logging --create-namespace"
+        command = "helm upgrade --install elastic-operator elastic/eck-operator -n logging --create-namespace"
         subprocess.run(command, shell=True, check=True)
         print("...installed Elasticsearch Operator successfully\n----------------------------------------------------------")
     except subprocess.CalledProcessError as e:
         print(f"An error occurred: {e}\n----------------------------------------------------------")
 
-    def countdown(minutes, seconds):
-        total_seconds = minutes * 60 + seconds
-        while total_seconds > 0:
-            mins, secs = divmod(total_seconds, 60)
-            timer = '{:02d}:{:02d}'.format(mins, secs)
-            print(timer, end="\r")
-            time.sleep(1)
-            total_seconds -= 1
-    minutes = int("0")
-    seconds = int("15")
-    countdown(minutes, seconds)
-
-# Install Elasticseach
-    print("Installing Elasticsearch...")
-    try:
-        # Command(s) to be executed inside a single subprocess shell
-        command = "kubectl apply -f es-storage-deploy.yaml"
-        subprocess.run(command, shell=True, check=True)
-        print("...installed Elasticsearch successfully\n----------------------------------------------------------")
-    except subprocess.CalledProcessError as e:
-        print(f"An error occurred: {e}\n----------------------------------------------------------")
-
-    def countdown(minutes, seconds):
-        total_seconds = minutes * 60 + seconds
-        while total_seconds > 0:
-            mins, secs = divmod(total_seconds, 60)
-            timer = '{:02d}:{:02d}'.format(mins, secs)
-            print(timer, end="\r")
-            time.sleep(1)
-            total_seconds -= 1
-    minutes = int("2")
-    seconds = int("30")
-    countdown(minutes, seconds)
+# Install Elasticseach - the waits only apply when the manifest is applied
+    if artifact_changed("es-storage-deploy.yaml", "kubectl get elasticsearch quickstart -n logging"):
+        def countdown(minutes, seconds):
+            total_seconds = minutes * 60 + seconds
+            while total_seconds > 0:
+                mins, secs = divmod(total_seconds, 60)
+                timer = '{:02d}:{:02d}'.format(mins, secs)
+                print(timer, end="\r")
+                time.sleep(1)
+                total_seconds -= 1
+        minutes = int("0")
+        seconds = int("15")
+        countdown(minutes, seconds)
+
+        print("Installing Elasticsearch...")
+        try:
+            # Command(s) to be executed inside a single subprocess shell
+            command = "kubectl apply -f es-storage-deploy.yaml"
+            subprocess.run(command, shell=True, check=True)
+            record_artifact("es-storage-deploy.yaml")
+            print("...installed Elasticsearch successfully\n----------------------------------------------------------")
+        except subprocess.CalledProcessError as e:
+            print(f"An error occurred: {e}\n----------------------------------------------------------")
+
+        minutes = int("2")
+        seconds = int("30")
+        countdown(minutes, seconds)
 
 # Install Kibana
-    print("Installing Kibana...")
-    try:
-        # Command(s) to be executed inside a single subprocess shell
-        command = "kubectl apply -f kibana-deploy.yaml"
-        subprocess.run(command, shell=True, check=True)
-        print("...installed Kibana successfully\n----------------------------------------------------------")
-    except subprocess.CalledProcessError as e:
-        print(f"An error occurred: {e}\n----------------------------------------------------------")
-
-    def countdown(minutes, seconds):
-        total_seconds = minutes * 60 + seconds
-        while total_seconds > 0:
-            mins, secs = divmod(total_seconds, 60)
-            timer = '{:02d}:{:02d}'.format(mins, secs)
-            print(timer, end="\r")
-            time.sleep(1)
-            total_seconds -= 1
-    minutes = int("3")
-    seconds = int("0")
-    countdown(minutes, seconds)
+    if artifact_changed("kibana-deploy.yaml", "kubectl get kibana quickstart -n logging"):
+        print("Installing Kibana...")
+        try:
+            # Command(s) to be executed inside a single subprocess shell
+            command = "kubectl apply -f kibana-deploy.yaml"
+            subprocess.run(command, shell=True, check=True)
+            record_artifact("kibana-deploy.yaml")
+            print("...installed Kibana successfully\n----------------------------------------------------------")
+        except subprocess.CalledProcessError as e:
+            print(f"An error occurred: {e}\n----------------------------------------------------------")
+
+        def countdown(minutes, seconds):
+            total_seconds = minutes * 60 + seconds
+            while total_seconds > 0:
+                mins, secs = divmod(total_seconds, 60)
+                timer = '{:02d}:{:02d}'.format(mins, secs)
+                print(timer, end="\r")
+                time.sleep(1)
+                total_seconds -= 1
+        minutes = int("3")
+        seconds = int("0")
+        countdown(minutes, seconds)
 
 # Install Fluentbit Operator
     print("Installing Fluent Operator using CRI: CRIO...")
@@ -746,26 +760,28 @@ hotReload:
     print("Finished creating the values.yaml file\n----------------------------------------------------------")
 
 # Install Fluentbit with values.yaml file
-    print("Installing Fluentbit...")
-    try:
-        # Command(s) to be executed inside a single subprocess shell
-        command = "helm upgrade --install fluent-bit fluent/fluent-bit --values values.yaml --namespace logging"
-        subprocess.run(command, shell=True, check=True)
-        print("...installed Fluentbit successfully\n----------------------------------------------------------")
-    except subprocess.CalledProcessError as e:
-        print(f"An error occurred: {e}\n----------------------------------------------------------")
-
-    def countdown(minutes, seconds):
-        total_seconds = minutes * 60 + seconds
-        while total_seconds > 0:
-            mins, secs = divmod(total_seconds, 60)
-            timer = '{:02d}:{:02d}'.format(mins, secs)
-            print(timer, end="\r")
-            time.sleep(1)
-            total_seconds -= 1
-    minutes = int("0")
-    seconds = int("20")
-    countdown(minutes, seconds)
+    if artifact_changed("values.yaml", "helm status fluent-bit -n logging"):
+        print("Installing Fluentbit...")
+        try:
+            # Command(s) to be executed inside a single subprocess shell
+            command = "helm upgrade --install fluent-bit fluent/fluent-bit --values values.yaml --namespace logging"
+            subprocess.run(command, shell=True, check=True)
+            record_artifact("values.yaml")
+            print("...installed Fluentbit successfully\n----------------------------------------------------------")
+        except subprocess.CalledProcessError as e:
+            print(f"An error occurred: {e}\n----------------------------------------------------------")
+
+        def countdown(minutes, seconds):
+            total_seconds = minutes * 60 + seconds
+            while total_seconds > 0:
+                mins, secs = divmod(total_seconds, 60)
+                timer = '{:02d}:{:02d}'.format(mins, secs)
+                print(timer, end="\r")
+                time.sleep(1)
+                total_seconds -= 1
+        minutes = int("0")
+        seconds = int("20")
+        countdown(minutes, seconds)
 
 #----------------------- END STACK INSTALL ------------------------
 
@@ -806,6 +822,28 @@ def Config_Create():
 # Add ES install manifest
     print("Creating Elasticsearch manifest with storage configuation...")
 
+    # On NFS mmap is unsafe and is turned off. On the local disk ES keeps mmap, which needs a higher vm.max_map_count
+    # on the node (set by a privileged init container), and runs on the logging worker that holds the PV
+    if k8_object_exists("kubectl get storageclass " + ES_LOCAL_STORAGE_CLASS):
+        print("StorageClass " + ES_LOCAL_STORAGE_CLASS + " found - Elasticsearch data goes on the logging worker local disk")
+        es_storage_class = ES_LOCAL_STORAGE_CLASS
+        es_node_config = """      node.store.allow_mmap: true
+    podTemplate:
+      spec:
+        nodeSelector:
+          """ + ES_NODE_ROLE_LABEL + """: logging
+        initContainers:
+        - name: sysctl
+          securityContext:
+            privileged: true
+            runAsUser: 0
+          command: ['sh', '-c', 'sysctl -w vm.max_map_count=""" + ES_MAX_MAP_COUNT + """']
+"""
+    else:
+        es_storage_class = "nfs-csi"
+        es_node_config = """      node.store.allow_mmap: false
+"""
+
     es_manifest = open(HOME_DIR + "es-storage-deploy.yaml", "w")
     es_manifest.write("""apiVersion: elasticsearch.k8s.elastic.co/v1
 kind: Elasticsearch
@@ -818,8 +856,7 @@ spec:
   - name: default
     count: 1
     config:
-      node.store.allow_mmap: false
-    volumeClaimTemplates:
+""" + es_node_config + """    volumeClaimTemplates:
     - metadata:
         name: elasticsearch-data
       spec:
@@ -828,7 +865,7 @@ spec:
         resources:
           requests:
             storage: 20Gi
-        storageClassName: nfs-csi""")
+        storageClassName: """ + es_storage_class)
     es_manifest.close()
     print("Elasticsearch manifest completed successfully\n----------------------------------------------------------")
 
@@ -911,6 +948,38 @@ spec:
 
 #---------------------- END CONFIGURATION CREATE -----------------------
 
+#------------------- START CHANGE DETECTION ------------------
+
+def k8_object_exists(command):
+    return subprocess.run(command, shell=True, capture_output=True).returncode == 0
+
+def load_artifact_hashes():
+    if not os.path.exists(ARTIFACT_HASH_FILE):
+        return {}
+    hash_file = open(ARTIFACT_HASH_FILE)
+    hashes = json.load(hash_file)
+    hash_file.close()
+    return hashes
+
+def artifact_hash(name):
+    return hashlib.sha256(pathlib.Path(HOME_DIR + name).read_bytes()).hexdigest()
+
+def artifact_changed(name, check_command):
+    # True when the generated file differs from the one last applied, or its objects are gone from the cluster
+    if load_artifact_hashes().get(name) == artifact_hash(name) and k8_object_exists(check_command):
+        print(name + " unchanged since its last apply... skipping\n----------------------------------------------------------")
+        return False
+    return True
+
+def record_artifact(name):
+    hashes = load_artifact_hashes()
+    hashes[name] = artifact_hash(name)
+    hash_file = open(ARTIFACT_HASH_FILE, "w")
+    json.dump(hashes, hash_file, indent=2)
+    hash_file.close()
+
+#-------------------- END CHANGE DETECTION -------------------
+
 #----------------------- START CLEAN UP ----------------------
 
 def Cleanup():